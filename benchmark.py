@@ -0,0 +1,368 @@
+"""Load benchmark for the bot's handlers and reminder fan-out.
+
+Drives the real handlers through Application.process_update with synthetic users
+and events. Telegram is replaced by an in-process Bot API stub, so the numbers
+cover handler, bot and database time only. By default the data goes to a fresh
+SQLite file; with --backend mysql the benchmark creates and fills the tables of
+the configured database (DB_* variables): use a throwaway database.
+
+    python benchmark.py --users 1000 --events 10000 --commands 2000 --due 500 --json bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import bot
+from outbox import OutboxRelay
+from scheduler import ReminderScheduler
+from sender import DeliveryQueue
+from storage import MySQLRepository, SQLiteRepository
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API stub answering every method locally and counting the calls"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.sent = 0
+        self.on_send = None
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[name] += 1
+
+        if name == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Pengingat', 'username': 'pengingat_bot'}
+        elif name in ('sendMessage', 'editMessageText'):
+            self._message_id += 1
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+            if name == 'sendMessage':
+                self.sent += 1
+                if self.on_send:
+                    self.on_send()
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class QueryCounter:
+    """Wraps the repository's connect() to count statements and their total time"""
+
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+        self.connections = 0
+        self.queries = 0
+        self.query_time = 0.0
+
+    def __call__(self):
+        conn = self.get_connection()
+        if conn is None:
+            return None
+        self.connections += 1
+        return _CountingConnection(conn, self)
+
+    def reset(self):
+        self.connections = self.queries = 0
+        self.query_time = 0.0
+
+
+class _CountingConnection:
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs), self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def _timed(self, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._counter.queries += 1
+            self._counter.query_time += time.perf_counter() - started
+
+    def execute(self, *args, **kwargs):
+        return self._timed(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed(self._cursor.executemany, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def seed(users, events, chunk=5000):
+    """Insert synthetic users (chat_id 1..users) and events spread over the next 30 days"""
+    for start in range(0, users, chunk):
+        bot.repo.save_user_names(
+            [(chat_id, f"User {chat_id}") for chat_id in range(start + 1, min(start + chunk, users) + 1)]
+        )
+
+    now = datetime.now()
+    for start in range(0, events, chunk):
+        rows = []
+        for _ in range(min(chunk, events - start)):
+            when = now + timedelta(minutes=random.randint(120, 30 * 24 * 60))
+            rows.append((
+                "Event sintetis", when, random.randint(1, users),
+                [minutes for minutes in (720, 240, 60) if random.randint(0, 1)]
+            ))
+        bot.repo.insert_jadwals(rows)
+
+
+def count_jadwals(name):
+    conn = bot.repo.connect()
+    cursor = bot.repo.cursor(conn)
+    try:
+        cursor.execute(bot.repo.sql("SELECT COUNT(*) FROM jadwal WHERE nama_event = %s"), (name,))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        bot.repo.release(conn)
+
+
+class UpdateFactory:
+    def __init__(self, application):
+        self.application = application
+        self.update_id = 0
+
+    def _next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def message(self, chat_id, text):
+        message = {
+            'message_id': self._next_id(),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f"User {chat_id}"},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.de_json({'update_id': self.update_id, 'message': message}, self.application.bot)
+
+    def callback(self, chat_id, data):
+        query = {
+            'id': str(self._next_id()),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f"User {chat_id}"},
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': self.update_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': 'Pilih pengingat',
+            },
+        }
+        return Update.de_json({'update_id': self.update_id, 'callback_query': query}, self.application.bot)
+
+
+async def run_commands(application, users, count, concurrency):
+    factory = UpdateFactory(application)
+    latencies = defaultdict(list)
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%d-%m-%Y')
+    semaphore = asyncio.Semaphore(concurrency)
+    # A chat's sessions run one after another, as its conversation state is per chat
+    chat_locks = defaultdict(asyncio.Lock)
+
+    async def session(i):
+        chat_id = i % users + 1
+        command = random.choice(['start', 'help', 'list', 'stop', 'tambah'])
+        if command == 'tambah':
+            steps = [
+                factory.message(chat_id, '/tambah'),
+                factory.message(chat_id, 'Rapat benchmark'),
+                factory.message(chat_id, tomorrow),
+                factory.message(chat_id, '10:00'),
+                factory.callback(chat_id, 'rec_none'),
+                factory.callback(chat_id, 'all'),
+            ]
+        else:
+            steps = [factory.message(chat_id, f'/{command}')]
+
+        async with chat_locks[chat_id], semaphore:
+            started = time.perf_counter()
+            for update in steps:
+                await application.process_update(update)
+            latencies[command].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(count)))
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies
+
+
+async def run_fanout(application, request, users, due, send_concurrency, send_rate, digest_window=None,
+                     outbox_workers=2):
+    """Time from the H-1 fire time of `due` events until every reminder reached the Bot API
+
+    Returns (seconds, messages sent). In digest mode each chat gets one message.
+    """
+    fire_at = datetime.now() + timedelta(seconds=3)
+    bot.repo.insert_jadwals(
+        [("Event fan-out", fire_at + timedelta(hours=1), i % users + 1, [60]) for i in range(due)]
+    )
+
+    done = asyncio.Event()
+    messages = due if digest_window is None else min(due, users)
+    target = request.sent + messages
+
+    def on_send():
+        if request.sent >= target:
+            done.set()
+    request.on_send = on_send
+
+    per_chat_rate = send_rate if send_rate else 1e9
+    queue = DeliveryQueue(application.bot, concurrency=send_concurrency,
+                          global_rate=send_rate or 1e9, per_chat_rate=per_chat_rate)
+    scheduler = ReminderScheduler(bot.repo.load_upcoming_reminders, digest_window=digest_window)
+    bot.outbox_relay = OutboxRelay(bot.repo, queue, workers=outbox_workers, on_finish=bot.count_delivery)
+    await queue.start()
+
+    tasks = [
+        asyncio.create_task(scheduler.run(bot.enqueue_reminders)),
+        asyncio.create_task(bot.outbox_relay.run()),
+    ]
+    try:
+        await asyncio.wait_for(done.wait(), timeout=600)
+        elapsed = (datetime.now() - fire_at).total_seconds()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.stop()
+    return elapsed, messages
+
+
+async def main(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+
+    if args.backend == 'sqlite':
+        path = args.db_path or os.path.join(tempfile.mkdtemp(prefix='pengingat-bench-'), 'bench.db')
+        bot.repo = SQLiteRepository(path)
+    else:
+        bot.repo = MySQLRepository()
+    if not bot.init_database():
+        raise SystemExit("Cannot initialize the benchmark database")
+
+    counter = QueryCounter(bot.repo.connect)
+    bot.repo.connect = counter
+
+    report = {'backend': args.backend, 'users': args.users, 'events': args.events}
+
+    started = time.perf_counter()
+    seed(args.users, args.events)
+    report['seed_seconds'] = round(time.perf_counter() - started, 3)
+
+    request = FakeTelegramRequest()
+    application = bot.build_application('123456:BENCHMARK', request=request)
+    async with application:
+        counter.reset()
+        elapsed, latencies = await run_commands(application, args.users, args.commands, args.concurrency)
+        total = sum(len(v) for v in latencies.values())
+        # Every /tambah session must have gone through the whole conversation
+        added = count_jadwals('Rapat benchmark')
+        if added != len(latencies['tambah']):
+            raise SystemExit(f"/tambah saved {added} of {len(latencies['tambah'])} jadwal")
+        report['commands'] = {
+            'count': total,
+            'seconds': round(elapsed, 3),
+            'per_second': round(total / elapsed, 1),
+            'db_queries': counter.queries,
+            'db_queries_per_command': round(counter.queries / total, 2),
+            'db_seconds': round(counter.query_time, 3),
+            'latency_ms': {
+                command: {
+                    'p50': round(percentile(values, 50) * 1000, 2),
+                    'p99': round(percentile(values, 99) * 1000, 2),
+                    'count': len(values),
+                }
+                for command, values in sorted(latencies.items())
+            },
+        }
+
+        if args.due:
+            counter.reset()
+            fanout, messages = await run_fanout(application, request, args.users, args.due,
+                                                args.send_concurrency, args.send_rate, args.digest_window,
+                                                args.outbox_workers)
+            report['fanout'] = {
+                'reminders': args.due,
+                'messages': messages,
+                'seconds': round(fanout, 3),
+                'per_second': round(args.due / fanout, 1),
+                'db_queries': counter.queries,
+            }
+
+    report['bot_api_calls'] = dict(request.calls)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--db-path', help="SQLite file for --backend sqlite (default: a new temporary file)")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--commands', type=int, default=2000, help="command sessions to run")
+    parser.add_argument('--concurrency', type=int, default=32, help="sessions in flight at once")
+    parser.add_argument('--due', type=int, default=500, help="reminders firing together in the fan-out run")
+    parser.add_argument('--send-concurrency', type=int, default=8)
+    parser.add_argument('--outbox-workers', type=int, default=2, help="outbox lease loops in the fan-out run")
+    parser.add_argument('--send-rate', type=float, default=0,
+                        help="global/per-chat send rate for the fan-out run; 0 measures without rate limits")
+    parser.add_argument('--digest-window', type=int, default=None,
+                        help="seconds; merge each chat's reminders in the fan-out run into one message")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="also write the report to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -2,7 +2,6 @@ import os
 import logging
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import mysql.connector
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -14,7 +13,21 @@ from telegram.ext import (
     ConversationHandler
 )
 import asyncio
-from threading import Thread
+import functools
+import time
+import importer
+import offsets
+import recurrence
+from scheduler import ReminderScheduler
+from db import run_db, DatabaseUnavailable
+from storage import create_repository
+from sender import DeliveryQueue
+from cache import TTLCache, UpcomingCache
+from persistence import RepositoryPersistence
+from retention import RetentionJob
+from outbox import OutboxRelay
+from webhook import run_webhook
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -54,116 +67,87 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database connection
-def get_db_connection():
-    try:
-        return mysql.connector.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASS'),
-            database=os.getenv('DB_NAME')
-        )
-    except mysql.connector.Error as err:
-        logger.error(f"Database connection error: {err}")
-        return None
+HANDLER_SECONDS = metrics.Histogram(
+    'pengingat_handler_seconds', "Handler latency per command or conversation step", labels=('handler',)
+)
+REMINDERS_TOTAL = metrics.Counter(
+    'pengingat_reminders_total', "Reminders by kind and outcome (due, sent, failed, skipped)",
+    labels=('kind', 'status')
+)
+
+def timed(callback):
+    # Records the handler's latency under its function name
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with HANDLER_SECONDS.time(handler=callback.__name__):
+            return await callback(update, context)
+    return wrapper
+
+# conversation_timeout needs the JobQueue, which is an optional extra of python-telegram-bot
+try:
+    import apscheduler  # noqa: F401
+    HAS_JOB_QUEUE = True
+except ImportError:
+    HAS_JOB_QUEUE = False
 
 # States for conversation
-GET_NAME, GET_EVENT_NAME, GET_EVENT_DATE, GET_EVENT_TIME, GET_REMINDER_CHOICE = range(5)
+(GET_NAME, GET_EVENT_NAME, GET_EVENT_DATE, GET_EVENT_TIME, GET_REMINDER_CHOICE, GET_RECURRENCE,
+ GET_CUSTOM_REMINDERS) = range(7)
+
+# Storage backend chosen by DB_BACKEND (MySQL by default, or embedded SQLite)
+repo = create_repository()
 
 # Initialize database tables
 def init_database():
-    conn = get_db_connection()
-    if conn is None:
-        logger.error("Cannot connect to database for initialization")
-        return False
-    
-    cursor = conn.cursor()
-    try:
-        # Create users table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                chat_id BIGINT UNIQUE NOT NULL,
-                name VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create jadwal table if not exists (with h1 column added)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS jadwal (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                nama_event VARCHAR(255) NOT NULL,
-                tanggal_event DATETIME NOT NULL,
-                chat_id BIGINT NOT NULL,
-                ingatkan_h12 TINYINT(1) DEFAULT 0,
-                ingatkan_h4 TINYINT(1) DEFAULT 0,
-                ingatkan_h1 TINYINT(1) DEFAULT 0,
-                is_active TINYINT(1) DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Add h1 column if it doesn't exist (for existing databases)
-        cursor.execute("""
-            ALTER TABLE jadwal 
-            ADD COLUMN IF NOT EXISTS ingatkan_h1 TINYINT(1) DEFAULT 0
-        """)
-        
-        # Add is_active column if it doesn't exist
-        cursor.execute("""
-            ALTER TABLE jadwal 
-            ADD COLUMN IF NOT EXISTS is_active TINYINT(1) DEFAULT 1
-        """)
-        
-        conn.commit()
-        logger.info("Database tables initialized successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Error initializing database: {e}")
-        return False
-    finally:
-        cursor.close()
-        conn.close()
+    return repo.init_schema()
+
+# chat_id -> registered name, kept in sync by save_user_name
+user_name_cache = TTLCache(maxsize=10000, ttl=3600)
 
 # Helper functions
 def get_user_name(chat_id):
-    conn = get_db_connection()
-    if conn is None:
-        return None
-    
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT name FROM users WHERE chat_id = %s", (chat_id,))
-        result = cursor.fetchone()
-        return result[0] if result else None
-    except Exception as e:
-        logger.error(f"Error getting user name: {e}")
-        return None
-    finally:
-        cursor.close()
-        conn.close()
+    name = repo.get_user_name(chat_id)
+    if name:
+        user_name_cache.set(chat_id, name)
+    return name
 
 def save_user_name(chat_id, name):
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            "INSERT INTO users (chat_id, name) VALUES (%s, %s) "
-            "ON DUPLICATE KEY UPDATE name = %s",
-            (chat_id, name, name)
-        )
-        conn.commit()
+    if repo.save_user_name(chat_id, name):
+        user_name_cache.set(chat_id, name)
         return True
-    except Exception as e:
-        logger.error(f"Error saving user name: {e}")
-        return False
-    finally:
-        cursor.close()
-        conn.close()
+    user_name_cache.invalidate(chat_id)
+    return False
+
+async def fetch_user_name(chat_id):
+    # Cache hits are answered without a trip through the DB thread pool
+    name = user_name_cache.get(chat_id)
+    if name is None:
+        name = await run_db(get_user_name, chat_id)
+    return name
+
+# Scheduler holding upcoming reminder fire times, fed by save_jadwal and handle_stop_callback.
+# DIGEST_WINDOW (seconds) merges a chat's reminders due within that window into one message.
+# Reminders missed while the bot or the database was down are caught up for CATCHUP_HOURS back.
+reminder_scheduler = ReminderScheduler(
+    repo.load_upcoming_reminders,
+    refresh_seconds=int(os.getenv('SCHEDULER_REFRESH_SECONDS', '60')),
+    digest_window=int(os.getenv('DIGEST_WINDOW')) if os.getenv('DIGEST_WINDOW') else None,
+    load_missed=repo.load_missed_reminders,
+    catch_up=timedelta(hours=float(os.getenv('CATCHUP_HOURS', '6')))
+)
+
+# Only the replica holding this lock runs the scheduler (always this process on SQLite)
+leader_lock = repo.leader_lock()
+LEADER_CHECK_SECONDS = 15
+
+# Archives (or deletes) expired jadwal on the leader; RETENTION_DAYS=0 turns it off
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '30'))
+retention_job = RetentionJob(
+    repo,
+    days=RETENTION_DAYS,
+    archive=os.getenv('RETENTION_MODE', 'archive').lower() != 'delete',
+    interval=int(os.getenv('RETENTION_INTERVAL', '3600')),
+) if RETENTION_DAYS > 0 else None
 
 # Bot commands
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -171,7 +155,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_id = update.effective_chat.id
     
     # Check if user already has a name
-    existing_name = get_user_name(chat_id)
+    existing_name = await fetch_user_name(chat_id)
     
     if existing_name:
         await update.message.reply_text(
@@ -200,7 +184,7 @@ async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("Nama terlalu pendek. Silakan masukkan nama yang valid (minimal 2 karakter):")
         return GET_NAME
     
-    if save_user_name(chat_id, name):
+    if await run_db(save_user_name, chat_id, name):
         await update.message.reply_text(
             f"Terima kasih {name}! 😊\n\n"
             "Sekarang Anda sudah terdaftar dan bisa menggunakan bot ini.\n\n"
@@ -218,7 +202,7 @@ async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def tambah_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_id = update.effective_chat.id
-    user_name = get_user_name(chat_id)
+    user_name = await fetch_user_name(chat_id)
     
     if not user_name:
         await update.message.reply_text(
@@ -287,33 +271,19 @@ async def get_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         context.user_data['event_datetime'] = event_datetime
         
         keyboard = [
+            [InlineKeyboardButton("Sekali saja", callback_data='rec_none')],
             [
-                InlineKeyboardButton("H-12 jam", callback_data='h12'),
-                InlineKeyboardButton("H-4 jam", callback_data='h4'),
-                InlineKeyboardButton("H-1 jam", callback_data='h1'),
-            ],
-            [
-                InlineKeyboardButton("H-12 & H-4", callback_data='h12_h4'),
-                InlineKeyboardButton("H-4 & H-1", callback_data='h4_h1'),
-            ],
-            [
-                InlineKeyboardButton("Semua (H-12, H-4, H-1)", callback_data='all'),
-                InlineKeyboardButton("Tidak perlu", callback_data='none'),
+                InlineKeyboardButton("Setiap hari", callback_data='rec_daily'),
+                InlineKeyboardButton("Setiap minggu", callback_data='rec_weekly'),
+                InlineKeyboardButton("Setiap bulan", callback_data='rec_monthly'),
             ]
         ]
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
-            f"📋 **Ringkasan Jadwal:**\n"
-            f"📅 Event: {context.user_data['event_name']}\n"
-            f"📆 Tanggal: {event_datetime.strftime('%d-%m-%Y')}\n"
-            f"⏰ Waktu: {event_datetime.strftime('%H:%M')}\n\n"
-            "🔔 Pilih pengingat yang diinginkan:",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
+            "🔁 Apakah jadwal ini berulang?",
+            reply_markup=InlineKeyboardMarkup(keyboard)
         )
-        return GET_REMINDER_CHOICE
+        return GET_RECURRENCE
     except ValueError:
         await update.message.reply_text(
             "❌ Format waktu tidak valid. Silakan kirim dalam format HH:MM\n"
@@ -321,64 +291,250 @@ async def get_event_time(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return GET_EVENT_TIME
 
-async def save_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def get_recurrence(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
     
-    chat_id = update.effective_chat.id
-    event_name = context.user_data['event_name']
     event_datetime = context.user_data['event_datetime']
+    frequency = query.data[len('rec_'):]
+    rule = recurrence.make_rule(frequency, event_datetime) if frequency != 'none' else None
+    context.user_data['recurrence'] = rule
     
-    # Determine reminder settings based on callback data
-    h12 = 1 if query.data in ['h12', 'h12_h4', 'all'] else 0
-    h4 = 1 if query.data in ['h4', 'h12_h4', 'h4_h1', 'all'] else 0
-    h1 = 1 if query.data in ['h1', 'h4_h1', 'all'] else 0
+    keyboard = [
+        [
+            InlineKeyboardButton("H-12 jam", callback_data='h12'),
+            InlineKeyboardButton("H-4 jam", callback_data='h4'),
+            InlineKeyboardButton("H-1 jam", callback_data='h1'),
+        ],
+        [
+            InlineKeyboardButton("H-12 & H-4", callback_data='h12_h4'),
+            InlineKeyboardButton("H-4 & H-1", callback_data='h4_h1'),
+        ],
+        [
+            InlineKeyboardButton("Semua (H-12, H-4, H-1)", callback_data='all'),
+            InlineKeyboardButton("Tidak perlu", callback_data='none'),
+        ],
+        [InlineKeyboardButton("⚙️ Atur sendiri (mis. 1 hari, 30 menit)", callback_data='custom')]
+    ]
     
-    conn = get_db_connection()
-    if conn is None:
-        await query.edit_message_text("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
-        return ConversationHandler.END
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    cursor = conn.cursor()
+    await query.edit_message_text(
+        f"📋 **Ringkasan Jadwal:**\n"
+        f"📅 Event: {context.user_data['event_name']}\n"
+        f"📆 Tanggal: {event_datetime.strftime('%d-%m-%Y')}\n"
+        f"⏰ Waktu: {event_datetime.strftime('%H:%M')}\n"
+        f"🔁 Ulangi: {recurrence.label(rule) if rule else 'Tidak'}\n\n"
+        "🔔 Pilih pengingat yang diinginkan:",
+        reply_markup=reply_markup,
+        parse_mode='Markdown'
+    )
+    return GET_REMINDER_CHOICE
+
+async def save_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
     
-    try:
-        cursor.execute(
-            "INSERT INTO jadwal (nama_event, tanggal_event, chat_id, ingatkan_h12, ingatkan_h4, ingatkan_h1) "
-            "VALUES (%s, %s, %s, %s, %s, %s)",
-            (event_name, event_datetime, chat_id, h12, h4, h1)
+    if query.data == 'custom':
+        rule = context.user_data.get('recurrence')
+        limit = "paling lama 30 hari sebelum event"
+        if rule:
+            period = recurrence.shortest_period(rule) // timedelta(minutes=1)
+            limit = f"kurang dari {offsets.format_offset(period)} sebelum event karena jadwal berulang"
+        await query.edit_message_text(
+            "⚙️ Kirim waktu pengingat sebelum event, pisahkan dengan koma.\n"
+            "Contoh: `1 hari, 2 jam, 30 menit` atau `1d 15m`\n\n"
+            f"Maksimal {offsets.MAX_OFFSETS} pengingat, {limit}.",
+            parse_mode='Markdown'
         )
-        conn.commit()
+        return GET_CUSTOM_REMINDERS
+    
+    return await store_jadwal(update, context, offsets.PRESET_CHOICES[query.data], query.edit_message_text)
+
+async def get_custom_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    rule = context.user_data.get('recurrence')
+    period = recurrence.shortest_period(rule) // timedelta(minutes=1) if rule else None
+    try:
+        minutes = offsets.parse_offsets(update.message.text, period)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}. Silakan coba lagi, contoh: 1 hari, 30 menit")
+        return GET_CUSTOM_REMINDERS
+    
+    return await store_jadwal(update, context, minutes, update.message.reply_text)
+
+async def store_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE, minutes, reply) -> int:
+    # Saves the jadwal from the /tambah answers with reminders `minutes` before the event
+    chat_id = update.effective_chat.id
+    event_name = context.user_data['event_name']
+    event_datetime = context.user_data['event_datetime']
+    rule = context.user_data.get('recurrence')
+    # The answers are no longer needed; an empty user_data drops its persisted row
+    context.user_data.clear()
+    
+    try:
+        jadwal_id = await run_db(repo.insert_jadwal, event_name, event_datetime, chat_id, minutes, rule)
         
-        reminder_text = []
-        if h12:
-            reminder_text.append("H-12 jam")
-        if h4:
-            reminder_text.append("H-4 jam")
-        if h1:
-            reminder_text.append("H-1 jam")
-        reminder_str = ", ".join(reminder_text) if reminder_text else "Tidak ada"
+        upcoming_cache.add(chat_id, {
+            'id': jadwal_id,
+            'nama_event': event_name,
+            'tanggal_event': event_datetime,
+            'is_active': 1,
+            'recurrence': rule,
+            'reminders': sorted(minutes, reverse=True),
+        })
+        user_name = await fetch_user_name(chat_id)
+        reminder_scheduler.schedule_reminders([
+            {
+                'id': jadwal_id,
+                'nama_event': event_name,
+                'tanggal_event': event_datetime,
+                'chat_id': chat_id,
+                'recurrence': rule,
+                'name': user_name,
+                'offset_minutes': offset,
+                'fire_at': event_datetime - timedelta(minutes=offset),
+            }
+            for offset in minutes
+        ])
         
-        await query.edit_message_text(
+        reminder_str = ", ".join(map(offsets.offset_label, minutes)) or "Tidak ada"
+        
+        await reply(
             f"✅ **Jadwal berhasil disimpan!**\n\n"
             f"📅 Event: {event_name}\n"
             f"📆 Tanggal: {event_datetime.strftime('%d-%m-%Y')}\n"
             f"⏰ Waktu: {event_datetime.strftime('%H:%M')}\n"
+            f"🔁 Ulangi: {recurrence.label(rule) if rule else 'Tidak'}\n"
             f"🔔 Pengingat: {reminder_str}\n\n"
             f"Gunakan /list untuk melihat semua jadwal Anda.",
             parse_mode='Markdown'
         )
+    except DatabaseUnavailable:
+        await reply("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error saving schedule: {e}")
-        await query.edit_message_text("❌ Gagal menyimpan jadwal. Silakan coba lagi.")
-    finally:
-        cursor.close()
-        conn.close()
+        await reply("❌ Gagal menyimpan jadwal. Silakan coba lagi.")
     
     return ConversationHandler.END
 
+# /list and /stop show LIST_PAGE_SIZE events per page with keyset navigation buttons
+LIST_PAGE_SIZE = 10
+
+# Later occurrences listed under a recurring jadwal
+RECURRENCE_PREVIEW = 3
+
+# Each chat's upcoming jadwal for /list and /stop, loaded on first use and kept current by
+# store_jadwal and handle_stop_callback; bounded by UPCOMING_CACHE_CHATS chats (LRU) of up
+# to UPCOMING_CACHE_EVENTS events, and reloaded after UPCOMING_CACHE_TTL seconds
+upcoming_cache = UpcomingCache(
+    maxsize=int(os.getenv('UPCOMING_CACHE_CHATS', '10000')),
+    ttl=int(os.getenv('UPCOMING_CACHE_TTL', '60')),
+    max_events=int(os.getenv('UPCOMING_CACHE_EVENTS', '200')),
+)
+
+# (chat_id, page key) -> last rendered /list page, shown while the database is unavailable
+stale_list_cache = TTLCache(maxsize=10000, ttl=int(os.getenv('LIST_STALE_SECONDS', '900')))
+STALE_LIST_NOTE = "\n\n⚠️ _Database sedang tidak tersedia, daftar ini mungkin belum terbaru._"
+
+def page_callback(view, direction, offset, jadwal):
+    # view:direction:offset:tanggal_event:id, well under Telegram's 64-byte callback_data limit
+    return f"{view}:{direction}:{offset}:{jadwal['tanggal_event'].strftime('%Y%m%d%H%M%S%f')}:{jadwal['id']}"
+
+def parse_page_callback(data):
+    view, direction, offset, tanggal, jadwal_id = data.split(':')
+    return view, direction, int(offset), (datetime.strptime(tanggal, '%Y%m%d%H%M%S%f'), int(jadwal_id))
+
+def render_list_page(user_name, jadwals, offset):
+    message = f"📋 **Daftar Jadwal {user_name}:**\n\n"
+    for i, jadwal in enumerate(jadwals, offset + 1):
+        status = "🟢 Aktif" if jadwal['is_active'] else "🔴 Tidak Aktif"
+        message += (
+            f"{i}. 📅 **{jadwal['nama_event']}**\n"
+            f"   📆 {jadwal['tanggal_event'].strftime('%d-%m-%Y')}\n"
+            f"   ⏰ {jadwal['tanggal_event'].strftime('%H:%M')}\n"
+            f"   🔔 Pengingat: "
+        )
+        message += ", ".join(map(offsets.offset_label, jadwal['reminders'])) or "Tidak ada"
+        if jadwal.get('recurrence'):
+            upcoming = recurrence.occurrences(jadwal['recurrence'], jadwal['tanggal_event'], RECURRENCE_PREVIEW + 1)[1:]
+            message += (
+                f"\n   🔁 {recurrence.label(jadwal['recurrence'])}, berikutnya: "
+                + ", ".join(when.strftime('%d-%m') for when in upcoming)
+            )
+        message += f"\n   {status}\n\n"
+    
+    message += "Gunakan /stop untuk menghentikan pengingat jadwal tertentu."
+    return message
+
+async def load_jadwals_page(chat_id, after=None, before=None):
+    # (rows, more) of one page, from upcoming_cache when it covers the page
+    now = datetime.now()
+    page = upcoming_cache.page(chat_id, now, LIST_PAGE_SIZE, after, before)
+    if page is not None:
+        return page
+    if not upcoming_cache.cached(chat_id, now):
+        token = upcoming_cache.token()
+        jadwals, more = await run_db(repo.get_active_jadwals_page, chat_id, upcoming_cache.max_events)
+        upcoming_cache.set(chat_id, jadwals, not more, token)
+        page = upcoming_cache.page(chat_id, now, LIST_PAGE_SIZE, after, before)
+        if page is not None:
+            return page
+    # Past the cached events of a chat with very many
+    return await run_db(repo.get_active_jadwals_page, chat_id, LIST_PAGE_SIZE, after=after, before=before)
+
+async def jadwal_page(chat_id, view, user_name, offset=0, after=None, before=None):
+    """Rendered (text, reply_markup) of one /list ('lp') or /stop ('sp') page, or None if it is empty"""
+    key = (view, offset, after, before)
+    try:
+        jadwals, more = await load_jadwals_page(chat_id, after=after, before=before)
+    except DatabaseUnavailable:
+        # Read-only /list pages fall back to their last rendering; /stop needs the database anyway
+        stale = stale_list_cache.get((chat_id, key)) if view == 'lp' else None
+        if stale is None:
+            raise
+        text, reply_markup = stale
+        return text + STALE_LIST_NOTE, reply_markup
+    if not jadwals:
+        return None
+    has_prev = more if before is not None else after is not None
+    has_next = more if before is None else True
+    
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            "⬅️ Sebelumnya", callback_data=page_callback(view, 'p', max(offset - LIST_PAGE_SIZE, 0), jadwals[0])
+        ))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            "Berikutnya ➡️", callback_data=page_callback(view, 'n', offset + len(jadwals), jadwals[-1])
+        ))
+    
+    if view == 'lp':
+        text = render_list_page(user_name, jadwals, offset)
+        keyboard = [navigation] if navigation else []
+    else:
+        text = (
+            f"🔴 **Hentikan Pengingat Jadwal**\n\n"
+            f"Pilih jadwal yang ingin dihentikan pengingatnya:"
+        )
+        keyboard = []
+        for jadwal in jadwals:
+            button_text = f"{jadwal['nama_event']} - {jadwal['tanggal_event'].strftime('%d/%m %H:%M')}"
+            if jadwal.get('recurrence'):
+                button_text = "🔁 " + button_text
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"stop_{jadwal['id']}")])
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("❌ Batal", callback_data="cancel_stop")])
+    
+    page = (text, InlineKeyboardMarkup(keyboard) if keyboard else None)
+    if view == 'lp':
+        stale_list_cache.set((chat_id, key), page)
+    return page
+
 async def list_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    user_name = get_user_name(chat_id)
+    user_name = await fetch_user_name(chat_id)
     
     if not user_name:
         await update.message.reply_text(
@@ -386,22 +542,10 @@ async def list_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
         return
     
-    conn = get_db_connection()
-    if conn is None:
-        await update.message.reply_text("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
-        return
-    
-    cursor = conn.cursor(dictionary=True)
-    
     try:
-        cursor.execute(
-            "SELECT id, nama_event, tanggal_event, ingatkan_h12, ingatkan_h4, ingatkan_h1, is_active "
-            "FROM jadwal WHERE chat_id = %s AND tanggal_event > NOW() AND is_active = 1 ORDER BY tanggal_event",
-            (chat_id,)
-        )
-        jadwals = cursor.fetchall()
+        page = await jadwal_page(chat_id, 'lp', user_name)
         
-        if not jadwals:
+        if not page:
             await update.message.reply_text(
                 f"Halo {user_name}! 📋\n\n"
                 "Anda belum memiliki jadwal aktif atau semua jadwal sudah berlalu.\n\n"
@@ -409,38 +553,17 @@ async def list_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             )
             return
         
-        message = f"📋 **Daftar Jadwal {user_name}:**\n\n"
-        for i, jadwal in enumerate(jadwals, 1):
-            status = "🟢 Aktif" if jadwal['is_active'] else "🔴 Tidak Aktif"
-            message += (
-                f"{i}. 📅 **{jadwal['nama_event']}**\n"
-                f"   📆 {jadwal['tanggal_event'].strftime('%d-%m-%Y')}\n"
-                f"   ⏰ {jadwal['tanggal_event'].strftime('%H:%M')}\n"
-                f"   🔔 Pengingat: "
-            )
-            reminders = []
-            if jadwal['ingatkan_h12']:
-                reminders.append("H-12 jam")
-            if jadwal['ingatkan_h4']:
-                reminders.append("H-4 jam")
-            if jadwal['ingatkan_h1']:
-                reminders.append("H-1 jam")
-            message += ", ".join(reminders) if reminders else "Tidak ada"
-            message += f"\n   {status}\n\n"
-        
-        message += "Gunakan /stop untuk menghentikan pengingat jadwal tertentu."
-        
-        await update.message.reply_text(message, parse_mode='Markdown')
+        text, reply_markup = page
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    except DatabaseUnavailable:
+        await update.message.reply_text("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error fetching schedules: {e}")
         await update.message.reply_text("❌ Gagal mengambil daftar jadwal. Silakan coba lagi.")
-    finally:
-        cursor.close()
-        conn.close()
 
 async def stop_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    user_name = get_user_name(chat_id)
+    user_name = await fetch_user_name(chat_id)
     
     if not user_name:
         await update.message.reply_text(
@@ -448,51 +571,52 @@ async def stop_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
         return
     
-    conn = get_db_connection()
-    if conn is None:
-        await update.message.reply_text("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
-        return
-    
-    cursor = conn.cursor(dictionary=True)
-    
     try:
-        cursor.execute(
-            "SELECT id, nama_event, tanggal_event "
-            "FROM jadwal WHERE chat_id = %s AND tanggal_event > NOW() AND is_active = 1 ORDER BY tanggal_event",
-            (chat_id,)
-        )
-        jadwals = cursor.fetchall()
+        page = await jadwal_page(chat_id, 'sp', user_name)
         
-        if not jadwals:
+        if not page:
             await update.message.reply_text(
                 f"Halo {user_name}! 🔴\n\n"
                 "Tidak ada jadwal aktif yang bisa dihentikan."
             )
             return
         
-        # Create inline keyboard with schedule options
-        keyboard = []
-        for jadwal in jadwals:
-            button_text = f"{jadwal['nama_event']} - {jadwal['tanggal_event'].strftime('%d/%m %H:%M')}"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"stop_{jadwal['id']}")])
-        
-        keyboard.append([InlineKeyboardButton("❌ Batal", callback_data="cancel_stop")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            f"🔴 **Hentikan Pengingat Jadwal**\n\n"
-            f"Pilih jadwal yang ingin dihentikan pengingatnya:",
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+        text, reply_markup = page
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
         
+    except DatabaseUnavailable:
+        await update.message.reply_text("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error fetching schedules for stop: {e}")
         await update.message.reply_text("❌ Gagal mengambil daftar jadwal. Silakan coba lagi.")
-    finally:
-        cursor.close()
-        conn.close()
+
+async def handle_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    
+    chat_id = update.effective_chat.id
+    view, direction, offset, anchor = parse_page_callback(query.data)
+    user_name = await fetch_user_name(chat_id)
+    
+    try:
+        if direction == 'n':
+            page = await jadwal_page(chat_id, view, user_name, offset, after=anchor)
+        else:
+            page = await jadwal_page(chat_id, view, user_name, offset, before=anchor)
+        if not page:
+            # The events around the button have passed or were stopped meanwhile
+            page = await jadwal_page(chat_id, view, user_name)
+        if not page:
+            await query.edit_message_text("Tidak ada jadwal aktif.")
+            return
+        
+        text, reply_markup = page
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    except DatabaseUnavailable:
+        await query.edit_message_text("❌ Gagal terhubung ke database.")
+    except Exception as e:
+        logger.error(f"Error paging schedules: {e}")
+        await query.edit_message_text("❌ Gagal mengambil daftar jadwal. Silakan coba lagi.")
 
 async def handle_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
@@ -506,31 +630,15 @@ async def handle_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         jadwal_id = int(query.data.split("_")[1])
         chat_id = update.effective_chat.id
         
-        conn = get_db_connection()
-        if conn is None:
-            await query.edit_message_text("❌ Gagal terhubung ke database.")
-            return
-        
-        cursor = conn.cursor(dictionary=True)
-        
         try:
-            # Get schedule details first
-            cursor.execute(
-                "SELECT nama_event, tanggal_event FROM jadwal WHERE id = %s AND chat_id = %s",
-                (jadwal_id, chat_id)
-            )
-            jadwal = cursor.fetchone()
+            jadwal = await run_db(repo.deactivate_jadwal, jadwal_id, chat_id)
             
             if not jadwal:
                 await query.edit_message_text("❌ Jadwal tidak ditemukan.")
                 return
             
-            # Deactivate the schedule
-            cursor.execute(
-                "UPDATE jadwal SET is_active = 0 WHERE id = %s AND chat_id = %s",
-                (jadwal_id, chat_id)
-            )
-            conn.commit()
+            reminder_scheduler.cancel_jadwal(jadwal_id)
+            upcoming_cache.remove(chat_id, jadwal_id)
             
             await query.edit_message_text(
                 f"✅ **Pengingat dihentikan!**\n\n"
@@ -540,16 +648,92 @@ async def handle_stop_callback(update: Update, context: ContextTypes.DEFAULT_TYP
                 parse_mode='Markdown'
             )
             
+        except DatabaseUnavailable:
+            await query.edit_message_text("❌ Gagal terhubung ke database.")
         except Exception as e:
             logger.error(f"Error stopping reminder: {e}")
             await query.edit_message_text("❌ Gagal menghentikan pengingat.")
-        finally:
-            cursor.close()
-            conn.close()
+
+async def import_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text(
+        "📥 **Impor Jadwal**\n\n"
+        "Kirim file `.csv` atau `.ics` (iCalendar) ke chat ini.\n\n"
+        "Format CSV, satu jadwal per baris:\n"
+        "`nama_event,tanggal,waktu,pengingat`\n"
+        "Contoh: `Rapat tim,25-12-2024,14:30,h12 h1`\n\n"
+        "• Tanggal: DD-MM-YYYY, waktu: HH:MM, harus di masa depan\n"
+        "• Pengingat (opsional): h12, h4, h1, all, none atau waktu bebas seperti `1 hari 30 menit`; "
+        "kosong berarti H-12, H-4 dan H-1; untuk jadwal berulang harus lebih pendek dari jarak pengulangannya\n"
+        "• File .ics: setiap event dengan jam mulai diimpor; alarm (VALARM) menjadi pengingatnya",
+        parse_mode='Markdown'
+    )
+
+async def import_jadwal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = update.effective_chat.id
+    document = update.message.document
+    user_name = await fetch_user_name(chat_id)
+    
+    if not user_name:
+        await update.message.reply_text(
+            "Anda belum terdaftar. Silakan ketik /start terlebih dahulu untuk mendaftar."
+        )
+        return
+    
+    if document.file_size and document.file_size > importer.IMPORT_MAX_BYTES:
+        await update.message.reply_text("❌ File terlalu besar (maksimal 20 MB).")
+        return
+    
+    fmt = 'ics' if (document.file_name or '').lower().endswith('.ics') else 'csv'
+    status = await update.message.reply_text("⏳ Mengimpor jadwal...")
+    loop = asyncio.get_running_loop()
+    updates = []
+    last_update = time.monotonic()
+    
+    def progress(imported, failed):
+        # Called from the DB thread after each chunk; edits are throttled to one per few seconds
+        nonlocal last_update
+        if time.monotonic() - last_update < 3:
+            return
+        last_update = time.monotonic()
+        updates.append(asyncio.run_coroutine_threadsafe(
+            status.edit_text(f"⏳ Mengimpor jadwal... {imported} tersimpan, {failed} ditolak"), loop
+        ))
+    
+    try:
+        data = await (await document.get_file()).download_as_bytearray()
+        imported, failed, errors = await run_db(
+            importer.import_events, repo, chat_id, bytes(data), fmt, progress=progress
+        )
+    except DatabaseUnavailable:
+        await status.edit_text("❌ Gagal terhubung ke database. Silakan coba lagi nanti.")
+        return
+    except Exception as e:
+        logger.error(f"Error importing schedules: {e}")
+        await status.edit_text("❌ Gagal mengimpor jadwal. Silakan coba lagi.")
+        return
+    finally:
+        # Let pending progress edits land before the final one
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in updates), return_exceptions=True)
+    
+    if imported:
+        upcoming_cache.invalidate(chat_id)
+        reminder_scheduler.refresh()
+    
+    message = f"✅ Impor selesai!\n\n📥 {imported} jadwal tersimpan"
+    if failed:
+        message += f"\n⚠️ {failed} baris ditolak:\n"
+        message += "\n".join(f"• baris {line}: {reason}" for line, reason in errors)
+        if failed > len(errors):
+            message += f"\n• ... dan {failed - len(errors)} lainnya"
+    message += "\n\nGunakan /list untuk melihat jadwal Anda."
+    await status.edit_text(message)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    user_name = get_user_name(chat_id)
+    try:
+        user_name = await fetch_user_name(chat_id)
+    except DatabaseUnavailable:
+        user_name = None  # the help text does not need the database
     
     greeting = f"Halo {user_name}! " if user_name else "Halo! "
     
@@ -560,11 +744,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "• `/tambah` - Tambah jadwal baru\n"
         "• `/list` - Lihat daftar jadwal aktif\n"
         "• `/stop` - Hentikan pengingat jadwal\n"
+        "• `/import` - Impor banyak jadwal dari file CSV/ICS\n"
         "• `/help` - Tampilkan bantuan ini\n\n"
         "⏰ **Opsi Pengingat:**\n"
         "• H-12 jam - Pengingat 12 jam sebelum event\n"
         "• H-4 jam - Pengingat 4 jam sebelum event\n"
-        "• H-1 jam - Pengingat 1 jam sebelum event\n\n"
+        "• H-1 jam - Pengingat 1 jam sebelum event\n"
+        "• Atur sendiri - Waktu bebas, misalnya 1 hari atau 30 menit sebelum event\n\n"
         "📝 **Format Input:**\n"
         "• Tanggal: DD-MM-YYYY (contoh: 25-12-2024)\n"
         "• Waktu: HH:MM (contoh: 14:30)\n\n"
@@ -578,200 +764,333 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data.clear()
     await update.message.reply_text("❌ Operasi dibatalkan.")
     return ConversationHandler.END
 
+# Header and closing line of the message for the preset offsets; others use REMINDER_MESSAGE_DEFAULT
+REMINDER_MESSAGES = {
+    720: ("⏰ **Peringatan H-12 jam!**", "Jangan lupa persiapkan diri Anda! 🚀"),
+    240: ("🔔 **Peringatan H-4 jam!**", "Event akan segera dimulai! ⏰"),
+    60: ("🚨 **Peringatan H-1 jam!**", "Event akan dimulai dalam 1 jam! Bersiaplah! 🔥"),
+}
+REMINDER_MESSAGE_DEFAULT = ("⏰ **Pengingat: {duration} lagi!**", "Jangan lupa! 🔔")
+
+def render_reminder(reminder):
+    minutes = reminder['offset_minutes']
+    header, footer = REMINDER_MESSAGES.get(minutes, REMINDER_MESSAGE_DEFAULT)
+    return (
+        f"{header.format(duration=offsets.format_offset(minutes))}\n\n"
+        f"📅 Event: {reminder['nama_event']}\n"
+        f"🕐 Waktu: {reminder['tanggal_event'].strftime('%d-%m-%Y %H:%M')}\n\n"
+        f"{footer}"
+    )
+
+# Telegram rejects longer messages; the limit counts UTF-16 code units, so emoji count twice
+MAX_MESSAGE_LENGTH = 4096
+
+def message_length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+def fit_lines(header, lines, footer, limit=MAX_MESSAGE_LENGTH):
+    # header + as many lines as fit within limit + "… dan N lainnya" for the rest + footer
+    budget = limit - message_length(header + footer + f"… dan {len(lines)} lainnya\n")
+    shown = 0
+    for line in lines:
+        budget -= message_length(line)
+        if budget < 0:
+            break
+        shown += 1
+    more = f"… dan {len(lines) - shown} lainnya\n" if shown < len(lines) else ""
+    return header + "".join(lines[:shown]) + more + footer
+
+def render_digest(reminders, limit=MAX_MESSAGE_LENGTH):
+    # Several reminders of one chat merged into one message, soonest event first
+    lines = [
+        f"📅 **{reminder['nama_event']}**\n"
+        f"   🕐 {reminder['tanggal_event'].strftime('%d-%m-%Y %H:%M')} "
+        f"({offsets.format_offset(reminder['offset_minutes'])} lagi)\n"
+        for reminder in sorted(reminders, key=lambda r: (r['tanggal_event'], r['nama_event']))
+    ]
+    return fit_lines(
+        f"🔔 **{len(reminders)} pengingat jadwal Anda:**\n\n", lines,
+        "\nJangan lupa persiapkan diri Anda! 🚀", limit
+    )
+
+def render_reminders(reminders):
+    # Names come with the scheduler's batch query, no per-reminder lookup
+    user_name = reminders[0].get('name')
+    greeting = f"Halo {user_name}! " if user_name else "Halo! "
+    if len(reminders) == 1:
+        return greeting + render_reminder(reminders[0])
+    return greeting + render_digest(reminders, MAX_MESSAGE_LENGTH - message_length(greeting))
+
+# Caught-up reminders later than this are reported as missed instead of sent as usual
+CATCHUP_GRACE = timedelta(minutes=5)
+
+def render_missed(reminders):
+    # Catch-up after downtime: slightly late reminders go out as usual, otherwise one
+    # compact summary per chat listing each event once with its real status
+    now = datetime.now()
+    if all(now - reminder['fire_at'] <= CATCHUP_GRACE for reminder in reminders):
+        return render_reminders(reminders)
+    events = {reminder['id']: reminder for reminder in reminders}
+    user_name = reminders[0].get('name')
+    lines = []
+    for event in sorted(events.values(), key=lambda r: (r['tanggal_event'], r['nama_event'])):
+        minutes = int((event['tanggal_event'] - now).total_seconds() // 60)
+        if minutes >= 1:
+            status = f"{offsets.format_offset(minutes)} lagi"
+        elif minutes >= 0:
+            status = "segera dimulai"
+        else:
+            status = "sudah lewat"
+        lines.append(
+            f"📅 **{event['nama_event']}**\n"
+            f"   🕐 {event['tanggal_event'].strftime('%d-%m-%Y %H:%M')} ({status})\n"
+        )
+    header = (f"Halo {user_name}! " if user_name else "Halo! ") + (
+        "⚠️ **Pengingat terlewat**\n"
+        "Bot sempat tidak dapat mengirim pengingat untuk jadwal berikut:\n\n"
+    )
+    return fit_lines(header, lines, "")
+
+async def enqueue_reminders(reminders, render=render_reminders):
+    """Claim reminders due for one chat and write their message (single or digest) to the outbox
+
+    Returns False when the database is unavailable; the scheduler catches those up later.
+    """
+    for reminder in reminders:
+        REMINDERS_TOTAL.inc(kind=offsets.offset_kind(reminder['offset_minutes']), status='due')
+    claimed = await run_db(repo.enqueue_reminders, reminders, render)
+    if claimed is None:
+        logger.error(f"Cannot enqueue {len(reminders)} reminder(s) for chat {reminders[0]['chat_id']}, will catch up")
+        return False
+    for reminder in reminders:
+        if reminder not in claimed:
+            logger.info(f"Reminder for event {reminder['nama_event']} already claimed, skipping")
+            REMINDERS_TOTAL.inc(kind=offsets.offset_kind(reminder['offset_minutes']), status='skipped')
+    if claimed:
+        outbox_relay.notify()
+    return True
+
+def count_delivery(message, status):
+    # Outbox relay callback: per-reminder sent/failed counts (retries are only in pengingat_outbox_total)
+    if status == 'retried':
+        return
+    for _, minutes in message['reminders']:
+        REMINDERS_TOTAL.inc(kind=offsets.offset_kind(minutes), status=status)
+    log = logger.info if status == 'sent' else logger.error
+    log(f"Reminder message to {message['chat_id']} {status} ({len(message['reminders'])} reminder(s))")
+
 # Global variable to track if reminders are already running
 reminder_running = False
 
+# Delivers the outbox written by enqueue_reminders; created with the send queue in check_reminders
+outbox_relay = None
+
 async def check_reminders(app: Application):
-    global reminder_running
+    global reminder_running, outbox_relay
     if reminder_running:
         return
     
     reminder_running = True
     logger.info("Starting reminder checker...")
     
-    while True:
-        try:
-            now = datetime.now()
-            conn = get_db_connection()
-            if conn is None:
-                logger.error("Cannot connect to database for reminder check")
-                await asyncio.sleep(1800)  # Wait 30 minutes before retry
+    queue = DeliveryQueue(app.bot, concurrency=int(os.getenv('SEND_CONCURRENCY', '8')))
+    outbox_relay = OutboxRelay(
+        repo, queue, workers=int(os.getenv('OUTBOX_WORKERS', '2')), on_finish=count_delivery
+    )
+    await queue.start()
+    
+    async def dispatch(reminders):
+        return await enqueue_reminders(reminders)
+    
+    async def dispatch_missed(reminders):
+        return await enqueue_reminders(reminders, render_missed)
+    
+    tasks = []
+    try:
+        while True:
+            # Followers retry the lock periodically and take over when the leader's session ends
+            if not await run_db(leader_lock.acquire):
+                await asyncio.sleep(LEADER_CHECK_SECONDS)
                 continue
             
-            cursor = conn.cursor(dictionary=True)
-            
-            # Cek jadwal yang perlu diingatkan H-12 jam (11-13 jam dari sekarang)
-            cursor.execute(
-                "SELECT id, nama_event, tanggal_event, chat_id "
-                "FROM jadwal "
-                "WHERE ingatkan_h12 = 1 AND is_active = 1 "
-                "AND tanggal_event > NOW() "
-                "AND TIMESTAMPDIFF(HOUR, NOW(), tanggal_event) BETWEEN 11 AND 13"
-            )
-            h12_jadwals = cursor.fetchall()
-            
-            for jadwal in h12_jadwals:
-                try:
-                    user_name = get_user_name(jadwal['chat_id'])
-                    greeting = f"Halo {user_name}! " if user_name else "Halo! "
-                    
-                    await app.bot.send_message(
-                        chat_id=jadwal['chat_id'],
-                        text=f"{greeting}⏰ **Peringatan H-12 jam!**\n\n"
-                             f"📅 Event: {jadwal['nama_event']}\n"
-                             f"🕐 Waktu: {jadwal['tanggal_event'].strftime('%d-%m-%Y %H:%M')}\n\n"
-                             f"Jangan lupa persiapkan diri Anda! 🚀",
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"Sent H-12 reminder for event: {jadwal['nama_event']}")
-                except Exception as e:
-                    logger.error(f"Failed to send H-12 reminder: {e}")
-            
-            # Cek jadwal yang perlu diingatkan H-4 jam (3-5 jam dari sekarang)
-            cursor.execute(
-                "SELECT id, nama_event, tanggal_event, chat_id "
-                "FROM jadwal "
-                "WHERE ingatkan_h4 = 1 AND is_active = 1 "
-                "AND tanggal_event > NOW() "
-                "AND TIMESTAMPDIFF(HOUR, NOW(), tanggal_event) BETWEEN 3 AND 5"
-            )
-            h4_jadwals = cursor.fetchall()
-            
-            for jadwal in h4_jadwals:
-                try:
-                    user_name = get_user_name(jadwal['chat_id'])
-                    greeting = f"Halo {user_name}! " if user_name else "Halo! "
-                    
-                    await app.bot.send_message(
-                        chat_id=jadwal['chat_id'],
-                        text=f"{greeting}🔔 **Peringatan H-4 jam!**\n\n"
-                             f"📅 Event: {jadwal['nama_event']}\n"
-                             f"🕐 Waktu: {jadwal['tanggal_event'].strftime('%d-%m-%Y %H:%M')}\n\n"
-                             f"Event akan segera dimulai! ⏰",
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"Sent H-4 reminder for event: {jadwal['nama_event']}")
-                except Exception as e:
-                    logger.error(f"Failed to send H-4 reminder: {e}")
-            
-            # Cek jadwal yang perlu diingatkan H-1 jam (45-75 menit dari sekarang)
-            cursor.execute(
-                "SELECT id, nama_event, tanggal_event, chat_id "
-                "FROM jadwal "
-                "WHERE ingatkan_h1 = 1 AND is_active = 1 "
-                "AND tanggal_event > NOW() "
-                "AND TIMESTAMPDIFF(MINUTE, NOW(), tanggal_event) BETWEEN 45 AND 75"
-            )
-            h1_jadwals = cursor.fetchall()
+            logger.info("This replica is now the reminder leader")
+            tasks = [
+                asyncio.create_task(reminder_scheduler.run(dispatch, dispatch_missed)),
+                asyncio.create_task(outbox_relay.run()),
+            ]
+            if retention_job is not None:
+                tasks.append(asyncio.create_task(retention_job.run()))
+            while not any(task.done() for task in tasks) and await run_db(leader_lock.is_held):
+                await asyncio.sleep(LEADER_CHECK_SECONDS)
             
-            for jadwal in h1_jadwals:
-                try:
-                    user_name = get_user_name(jadwal['chat_id'])
-                    greeting = f"Halo {user_name}! " if user_name else "Halo! "
-                    
-                    await app.bot.send_message(
-                        chat_id=jadwal['chat_id'],
-                        text=f"{greeting}🚨 **Peringatan H-1 jam!**\n\n"
-                             f"📅 Event: {jadwal['nama_event']}\n"
-                             f"🕐 Waktu: {jadwal['tanggal_event'].strftime('%d-%m-%Y %H:%M')}\n\n"
-                             f"Event akan dimulai dalam 1 jam! Bersiaplah! 🔥",
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"Sent H-1 reminder for event: {jadwal['nama_event']}")
-                except Exception as e:
-                    logger.error(f"Failed to send H-1 reminder: {e}")
-                    
-        except Exception as e:
-            logger.error(f"Error in reminder checker: {e}")
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
-        
-        await asyncio.sleep(1800)  # Check every 30 minutes
+            stopped = [task for task in tasks if task.done()]
+            if stopped:
+                logger.error(f"Leader task stopped unexpectedly: {stopped[0].exception()}")
+            else:
+                logger.warning("Reminder leadership lost, stopping scheduler")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            tasks = []
+            reminder_scheduler.reset()
+            await asyncio.sleep(LEADER_CHECK_SECONDS)
+    finally:
+        # Stop the leader tasks while the queue drains, so the outbox relay records what went out
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(queue.stop(drain_timeout=10), *tasks, return_exceptions=True)
+        await run_db(leader_lock.release)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    logger.error(msg="Exception while handling an update:", exc_info=context.error)
+    if isinstance(context.error, DatabaseUnavailable):
+        # E.g. fetch_user_name for an uncached user while the database circuit breaker is open
+        logger.warning(f"Database unavailable while handling an update: {context.error}")
+        text = "❌ Gagal terhubung ke database. Silakan coba lagi nanti."
+    else:
+        logger.error(msg="Exception while handling an update:", exc_info=context.error)
+        text = 'Maaf, terjadi kesalahan. Silakan coba lagi.'
     
-    if update and update.message:
-        await update.message.reply_text('Maaf, terjadi kesalahan. Silakan coba lagi.')
+    if not isinstance(update, Update):
+        return
+    if update.message:
+        await update.message.reply_text(text)
+    elif update.callback_query and isinstance(context.error, DatabaseUnavailable):
+        await update.callback_query.edit_message_text(text)
 
-def run_scheduler(app: Application):
-    """Run the scheduler in a separate thread"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(check_reminders(app))
-    except Exception as e:
-        logger.error(f"Scheduler error: {e}")
-    finally:
-        loop.close()
+# Reminder task running on the Application's own event loop
+reminder_task = None
 
-def main():
-    # Validate environment variables
-    if not TOKEN:
-        logger.error("BOT_TOKEN not found in environment variables")
-        return
-    
-    # Initialize database
-    if not init_database():
-        logger.error("Failed to initialize database")
-        return
+async def post_init(application: Application) -> None:
+    global reminder_task
+    reminder_task = asyncio.create_task(check_reminders(application))
+
+async def post_stop(application: Application) -> None:
+    # Runs on shutdown (including SIGTERM); check_reminders drains the send queue before exiting
+    if reminder_task is not None:
+        reminder_task.cancel()
+        await asyncio.gather(reminder_task, return_exceptions=True)
+
+def build_application(token, request=None):
+    """Create the Application with all handlers; request overrides the Bot API transport"""
+    conversation_timeout = timedelta(seconds=int(os.getenv('CONVERSATION_TIMEOUT', '3600')))
+    # Updates are processed concurrently since DB work runs off the event loop
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(int(os.getenv('UPDATE_WORKERS', '256')))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        # Conversation states and /tambah answers survive restarts; written in batches
+        .persistence(RepositoryPersistence(
+            repo,
+            update_interval=float(os.getenv('PERSISTENCE_INTERVAL', '5')),
+            timeout=conversation_timeout,
+        ))
+    )
+    # Another Bot API server, e.g. a local fake Telegram for testing
+    if os.getenv('TELEGRAM_API_URL'):
+        builder = builder.base_url(os.getenv('TELEGRAM_API_URL'))
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
     
-    # Create the Application
-    application = Application.builder().token(TOKEN).build()
+    # Idle conversations expire in memory through the JobQueue (python-telegram-bot[job-queue],
+    # in requirements.txt); persisted ones past the timeout are dropped on startup either way
+    timeout = conversation_timeout if HAS_JOB_QUEUE else None
+    if not HAS_JOB_QUEUE:
+        logger.warning("python-telegram-bot[job-queue] is not installed: idle conversations only expire on restart")
     
     # Conversation handler for user registration
     registration_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
+        entry_points=[CommandHandler('start', timed(start))],
         states={
-            GET_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_name)],
+            GET_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_name))],
         },
-        fallbacks=[CommandHandler('cancel', cancel)],
+        fallbacks=[CommandHandler('cancel', timed(cancel))],
+        name='registration',
+        persistent=True,
+        conversation_timeout=timeout,
     )
     
     # Conversation handler for adding schedule
     schedule_handler = ConversationHandler(
-        entry_points=[CommandHandler('tambah', tambah_jadwal)],
+        entry_points=[CommandHandler('tambah', timed(tambah_jadwal))],
         states={
-            GET_EVENT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_event_name)],
-            GET_EVENT_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_event_date)],
-            GET_EVENT_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_event_time)],
-            GET_REMINDER_CHOICE: [CallbackQueryHandler(save_jadwal)],
+            GET_EVENT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_event_name))],
+            GET_EVENT_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_event_date))],
+            GET_EVENT_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_event_time))],
+            GET_RECURRENCE: [CallbackQueryHandler(timed(get_recurrence), pattern='^rec_(none|daily|weekly|monthly)$')],
+            GET_REMINDER_CHOICE: [
+                CallbackQueryHandler(timed(save_jadwal), pattern='^(h12|h4|h1|h12_h4|h4_h1|all|none|custom)$')
+            ],
+            GET_CUSTOM_REMINDERS: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_custom_reminders))],
         },
-        fallbacks=[CommandHandler('cancel', cancel)],
+        fallbacks=[CommandHandler('cancel', timed(cancel))],
+        name='tambah_jadwal',
+        persistent=True,
+        conversation_timeout=timeout,
     )
     
     # Register handlers
     application.add_handler(registration_handler)
     application.add_handler(schedule_handler)
-    application.add_handler(CommandHandler("list", list_jadwal))
-    application.add_handler(CommandHandler("stop", stop_reminder))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CallbackQueryHandler(handle_stop_callback, pattern="^(stop_|cancel_stop)"))
+    application.add_handler(CommandHandler("list", timed(list_jadwal)))
+    application.add_handler(CommandHandler("stop", timed(stop_reminder)))
+    application.add_handler(CommandHandler("help", timed(help_command)))
+    application.add_handler(CommandHandler("import", timed(import_help)))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension('csv') | filters.Document.FileExtension('ics'), timed(import_jadwal)
+    ))
+    application.add_handler(CallbackQueryHandler(timed(handle_stop_callback), pattern="^(stop_|cancel_stop)"))
+    application.add_handler(CallbackQueryHandler(timed(handle_page_callback), pattern="^(lp|sp):"))
     application.add_error_handler(error_handler)
     
+    return application
+
+def main():
+    # Validate environment variables
+    if not TOKEN:
+        logger.error("BOT_TOKEN not found in environment variables")
+        return
+    
+    # Initialize database
+    if not init_database():
+        logger.error("Failed to initialize database")
+        return
+    
+    # Create the Application
+    application = build_application(TOKEN)
+    
     # Test database connection
-    conn = get_db_connection()
-    if conn:
+    if repo.ping():
         logger.info("Database connection successful")
-        conn.close()
     else:
         logger.error("Failed to connect to database")
         return
     
-    # Start the scheduler in a separate thread
-    scheduler_thread = Thread(target=run_scheduler, args=(application,), daemon=True)
-    scheduler_thread.start()
+    # Local /metrics endpoint, never on the public webhook port
+    if os.getenv('METRICS_PORT'):
+        metrics.start_http_server(int(os.getenv('METRICS_PORT')), os.getenv('METRICS_LISTEN', '127.0.0.1'))
     
     logger.info("Bot started successfully")
     
     # Run the bot
-    application.run_polling(drop_pending_updates=True)
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_url:
+        run_webhook(
+            application,
+            webhook_url,
+            health_check=repo.ping,
+            listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('PORT', '8080')),
+            secret=os.getenv('WEBHOOK_SECRET')
+        )
+    else:
+        application.run_polling(drop_pending_updates=True)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after being set"""
+
+    def __init__(self, maxsize=10000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _event_key(event):
+    return event['tanggal_event'], event['id']
+
+
+class UpcomingCache:
+    """Thread-safe LRU cache of each chat's upcoming events in (tanggal_event, id) order
+
+    An entry holds the chat's first max_events upcoming events; `complete` tells whether
+    that is all of them. Pages that fall inside the entry are cut from it, later pages
+    are left to the database. Writers keep entries current with add() and remove(),
+    and entries are rebuilt after ttl seconds to pick up other replicas' changes.
+    Events leave the entry once their time has passed; an entry holding a passed
+    recurring event is dropped instead, so the reload moves the series on.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60, max_events=200):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_events = max_events
+        # chat_id -> [events, complete, expires_at]
+        self._data = OrderedDict()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def token(self):
+        """Take before loading an entry; set() skips it if a write happened meanwhile"""
+        with self._lock:
+            return self._writes
+
+    def set(self, chat_id, events, complete, token):
+        with self._lock:
+            if token != self._writes:
+                return
+            events = sorted(events, key=_event_key)[:self.max_events]
+            self._data[chat_id] = [events, complete, time.monotonic() + self.ttl]
+            self._data.move_to_end(chat_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _entry(self, chat_id, now):
+        # Caller must hold self._lock
+        entry = self._data.get(chat_id)
+        if entry is None:
+            return None
+        events = entry[0]
+        if entry[2] <= time.monotonic():
+            del self._data[chat_id]
+            return None
+        passed = 0
+        while passed < len(events) and events[passed]['tanggal_event'] <= now:
+            if events[passed].get('recurrence'):
+                del self._data[chat_id]
+                return None
+            passed += 1
+        del events[:passed]
+        self._data.move_to_end(chat_id)
+        return entry
+
+    def cached(self, chat_id, now):
+        with self._lock:
+            return self._entry(chat_id, now) is not None
+
+    def page(self, chat_id, now, limit, after=None, before=None):
+        """(rows, more) like Repository.get_active_jadwals_page, or None when the entry does not cover it"""
+        with self._lock:
+            entry = self._entry(chat_id, now)
+            if entry is None:
+                return None
+            events, complete, _ = entry
+            if before is not None:
+                # Everything before the anchor is cached if the anchor is inside the entry
+                if not complete and (not events or _event_key(events[-1]) < before):
+                    return None
+                rows = [event for event in events if _event_key(event) < before]
+                return rows[-limit:], len(rows) > limit
+            rows = [event for event in events if after is None or _event_key(event) > after]
+            if len(rows) > limit:
+                return rows[:limit], True
+            if complete:
+                return rows, False
+            return None
+
+    def add(self, chat_id, event):
+        """Insert a newly saved event into the chat's entry, if the chat is cached"""
+        with self._lock:
+            self._writes += 1
+            entry = self._data.get(chat_id)
+            if entry is None:
+                return
+            events, complete, _ = entry
+            if not complete and (not events or _event_key(event) > _event_key(events[-1])):
+                return  # beyond the cached part
+            events.append(event)
+            events.sort(key=_event_key)
+            if len(events) > self.max_events:
+                events.pop()
+                entry[1] = False
+
+    def remove(self, chat_id, jadwal_id):
+        with self._lock:
+            self._writes += 1
+            entry = self._data.get(chat_id)
+            if entry is not None:
+                entry[0] = [event for event in entry[0] if event['id'] != jadwal_id]
+
+    def invalidate(self, chat_id):
+        with self._lock:
+            self._writes += 1
+            self._data.pop(chat_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
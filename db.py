@@ -0,0 +1,188 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import mysql.connector
+from mysql.connector import pooling
+from metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_executor = None
+_breaker = None
+
+DB_ACQUIRE_SECONDS = Histogram(
+    'pengingat_db_connection_acquire_seconds', "Time to obtain a database connection"
+)
+DB_QUERY_SECONDS = Histogram(
+    'pengingat_db_query_seconds', "Time spent in each database helper", labels=('statement',)
+)
+
+DB_BREAKER_STATE = Gauge(
+    'pengingat_db_breaker_state', "Database circuit breaker: 0 closed, 1 open, 2 half-open"
+)
+
+class DatabaseUnavailable(Exception):
+    """Raised when no database connection can be obtained"""
+
+class CircuitBreaker:
+    """Stops connecting to a database that keeps failing, so callers fail at once
+
+    After `failures` consecutive failed connects the breaker opens and every connect
+    fails immediately. Once `cooldown` seconds have passed it is half-open: a single
+    caller probes the database while the others keep failing fast, and the probe's
+    outcome closes the breaker or opens it for another cooldown.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, failures=3, cooldown=5):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._failed = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a connect may be attempted now; a True in the open state is the probe"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self._opened_at + self.cooldown:
+                self._set(self.HALF_OPEN)
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                if self.state != self.CLOSED:
+                    logger.info("Database reachable again, circuit breaker closed")
+                self._failed = 0
+                self._set(self.CLOSED)
+                return
+            self._failed += 1
+            if self.state == self.HALF_OPEN or self._failed >= self.failures:
+                if self.state == self.CLOSED:
+                    logger.error(f"Database circuit breaker open after {self._failed} failed connects, "
+                                 f"failing fast for {self.cooldown}s")
+                self._opened_at = time.monotonic()
+                self._set(self.OPEN)
+
+    def _set(self, state):
+        # Caller must hold self._lock
+        self.state = state
+        DB_BREAKER_STATE.set(state)
+
+def _pool_size():
+    return int(os.getenv('DB_POOL_SIZE', '5'))
+
+def _connection_config():
+    return {
+        'host': os.getenv('DB_HOST'),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASS'),
+        'database': os.getenv('DB_NAME'),
+        # Short, so an unreachable server opens the breaker in seconds
+        'connection_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '3')),
+    }
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _pool_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failures=int(os.getenv('DB_BREAKER_FAILURES', '3')),
+                    cooldown=float(os.getenv('DB_BREAKER_COOLDOWN', '5')),
+                )
+    return _breaker
+
+def _get_pool():
+    # Created lazily so a database that is down at startup is retried on the next call
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool_size = _pool_size()
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name='pengingat',
+                    pool_size=pool_size,
+                    pool_reset_session=True,
+                    **_connection_config()
+                )
+                logger.info(f"Database pool created with {pool_size} connections")
+    return _pool
+
+def get_db_connection():
+    """Borrow a connection from the pool; close() hands it back instead of disconnecting
+
+    Returns None at once while the circuit breaker is open.
+    """
+    breaker = get_breaker()
+    if not breaker.allow():
+        return None
+    with DB_ACQUIRE_SECONDS.time():
+        conn = _acquire_connection()
+    breaker.record(conn is not None)
+    return conn
+
+def _acquire_connection():
+    try:
+        pool = _get_pool()
+    except mysql.connector.Error as err:
+        logger.error(f"Database connection error: {err}")
+        return None
+
+    # get_connection() pings the checked-out connection and reconnects it if the server dropped it
+    try:
+        return pool.get_connection()
+    except pooling.PoolError:
+        # Pool exhausted: serve the caller with a one-off connection rather than failing
+        logger.warning("Database pool exhausted, opening an overflow connection")
+        try:
+            return mysql.connector.connect(**_connection_config())
+        except mysql.connector.Error as err:
+            logger.error(f"Database connection error: {err}")
+            return None
+    except mysql.connector.Error as err:
+        logger.error(f"Database connection error: {err}")
+        return None
+
+def _get_executor():
+    # One worker per pooled connection, so queries queue here instead of exhausting the pool
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_pool_size(), thread_name_prefix='db')
+    return _executor
+
+def _timed(func, *args, **kwargs):
+    with DB_QUERY_SECONDS.time(statement=func.__name__):
+        return func(*args, **kwargs)
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database helper on the DB thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(_timed, func, *args, **kwargs))
+
+def connect_direct():
+    """Open a dedicated, non-pooled connection, e.g. for session-bound advisory locks"""
+    breaker = get_breaker()
+    if not breaker.allow():
+        return None
+    try:
+        conn = mysql.connector.connect(**_connection_config())
+    except mysql.connector.Error as err:
+        logger.error(f"Database connection error: {err}")
+        breaker.record(False)
+        return None
+    breaker.record(True)
+    return conn
@@ -0,0 +1,252 @@
+import csv
+import io
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+import offsets
+import recurrence
+
+logger = logging.getLogger(__name__)
+
+# Rows per transaction; progress is reported after each chunk
+IMPORT_CHUNK = 1000
+# Telegram bots cannot download files larger than 20 MB
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+MAX_ERRORS_KEPT = 10
+
+# Values accepted in the optional recurrence column
+RECURRENCE_CHOICES = {
+    '': None,
+    'tidak': None,
+    'none': None,
+    'harian': 'daily',
+    'daily': 'daily',
+    'mingguan': 'weekly',
+    'weekly': 'weekly',
+    'bulanan': 'monthly',
+    'monthly': 'monthly',
+}
+
+
+def validate_event(name, event_datetime, now, rule=None):
+    """The /tambah rules: a name and a time that is still in the future; raises ValueError
+
+    A recurring series that started in the past is moved to its next occurrence.
+    Returns (name, event_datetime).
+    """
+    name = (name or '').strip()
+    if not name:
+        raise ValueError("nama event kosong")
+    if len(name) > 255:
+        raise ValueError("nama event lebih dari 255 karakter")
+    if rule:
+        event_datetime = recurrence.next_occurrence(rule, event_datetime, now)
+    if event_datetime <= now:
+        raise ValueError("waktu event harus di masa depan")
+    return name, event_datetime
+
+
+def parse_recurrence(text, first):
+    key = text.strip().lower()
+    if key not in RECURRENCE_CHOICES:
+        raise ValueError(f"pengulangan tidak dikenal: {text.strip()}")
+    frequency = RECURRENCE_CHOICES[key]
+    return recurrence.make_rule(frequency, first) if frequency else None
+
+
+def _period(rule):
+    # Offsets of a recurring series must stay below the gap between occurrences
+    return recurrence.shortest_period(rule) // timedelta(minutes=1) if rule else None
+
+
+def parse_reminders(text, rule=None):
+    """'h12 h4', '1 hari, 30 menit', 'all', ... -> offsets in minutes; empty means H-12, H-4 and H-1"""
+    return offsets.parse_offsets(text, _period(rule)) if text and text.strip() else offsets.PRESET_CHOICES['all']
+
+
+def parse_csv(stream, now):
+    """Yield (line, row or None, error) for nama_event,tanggal,waktu[,pengingat[,ulang]] rows
+
+    tanggal is DD-MM-YYYY and waktu HH:MM like in /tambah; ulang is harian, mingguan
+    or bulanan. A header row and ';' as separator (spreadsheet exports) are accepted.
+    """
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.reader(stream, dialect)
+    for record in reader:
+        if not any(field.strip() for field in record):
+            continue
+        line = reader.line_num
+        if len(record) < 3:
+            yield line, None, "kolom kurang (nama_event, tanggal, waktu)"
+            continue
+        name, date_text, time_text = record[0], record[1].strip(), record[2].strip()
+        try:
+            event_date = datetime.strptime(date_text, '%d-%m-%Y').date()
+        except ValueError:
+            if line == 1:
+                continue  # header
+            yield line, None, "format tanggal tidak valid (DD-MM-YYYY)"
+            continue
+        try:
+            event_time = datetime.strptime(time_text, '%H:%M').time()
+        except ValueError:
+            yield line, None, "format waktu tidak valid (HH:MM)"
+            continue
+        event_datetime = datetime.combine(event_date, event_time)
+        try:
+            rule = parse_recurrence(record[4] if len(record) > 4 else '', event_datetime)
+            name, event_datetime = validate_event(name, event_datetime, now, rule)
+            reminders = parse_reminders(record[3] if len(record) > 3 else '', rule)
+        except ValueError as e:
+            yield line, None, str(e)
+            continue
+        yield line, (name, event_datetime, reminders, rule), None
+
+
+def _unfold(stream):
+    # iCalendar continues long lines on the next line starting with a space or tab
+    current, start = None, 0
+    for number, line in enumerate(stream, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, number
+    if current is not None:
+        yield start, current
+
+
+def _ics_text(value):
+    return (value.replace('\\n', ' ').replace('\\N', ' ').replace('\\,', ',')
+            .replace('\\;', ';').replace('\\\\', '\\'))
+
+
+def _ics_datetime(params, value):
+    if 'VALUE=DATE' in params or len(value) == 8:
+        raise ValueError("event sepanjang hari tidak didukung, perlu jam mulai")
+    if value.endswith('Z'):
+        utc = datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+        return utc.astimezone().replace(tzinfo=None, second=0)
+    # Floating or TZID times are taken as the bot's local time
+    return datetime.strptime(value, '%Y%m%dT%H%M%S').replace(second=0)
+
+
+def _ics_rule(value, first):
+    # Only plain daily/weekly/monthly repeats map onto jadwal.recurrence
+    parts = dict(part.partition('=')[::2] for part in value.upper().split(';') if part)
+    frequency = {'DAILY': 'daily', 'WEEKLY': 'weekly', 'MONTHLY': 'monthly'}.get(parts.pop('FREQ', None))
+    parts.pop('WKST', None)
+    if parts.get('INTERVAL', '1') == '1':
+        parts.pop('INTERVAL', None)
+    # Calendar apps spell out the start's own weekday/day of month; that adds nothing
+    if frequency == 'weekly' and parts.get('BYDAY') == ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')[first.weekday()]:
+        parts.pop('BYDAY')
+    if frequency == 'monthly' and parts.get('BYMONTHDAY') == str(first.day):
+        parts.pop('BYMONTHDAY')
+    if frequency is None or parts:
+        raise ValueError("aturan pengulangan tidak didukung (hanya harian/mingguan/bulanan tanpa batas)")
+    return recurrence.make_rule(frequency, first)
+
+
+_ICS_DURATION = re.compile(r'([+-]?)P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?')
+
+
+def _ics_trigger(params, value):
+    # Minutes before the start for a VALARM TRIGGER like -PT30M or -P1D; None when it does
+    # not map onto a reminder (absolute time, relative to the end, at or after the start)
+    if 'VALUE=DATE-TIME' in params or 'RELATED=END' in params:
+        return None
+    match = _ICS_DURATION.fullmatch(value.upper())
+    if not match or match.group(1) != '-':
+        return None
+    weeks, days, hours, minutes, _ = (int(part or 0) for part in match.groups()[1:])
+    total = ((weeks * 7 + days) * 24 + hours) * 60 + minutes
+    return total or None
+
+
+def parse_ics(stream, now):
+    """Yield (line, row or None, error) for each VEVENT with SUMMARY and DTSTART
+
+    VALARM triggers before the start become the event's reminders; events without
+    alarms get H-12, H-4 and H-1.
+    """
+    event = None
+    for line, content in _unfold(stream):
+        if content == 'BEGIN:VEVENT':
+            event = {'line': line, 'alarms': set()}
+            continue
+        if event is None:
+            continue
+        if content == 'END:VEVENT':
+            try:
+                if 'DTSTART' not in event:
+                    raise ValueError("DTSTART tidak ada")
+                event_datetime = _ics_datetime(*event['DTSTART'])
+                rule = _ics_rule(event['RRULE'], event_datetime) if 'RRULE' in event else None
+                name, event_datetime = validate_event(event.get('SUMMARY'), event_datetime, now, rule)
+                reminders = offsets.PRESET_CHOICES['all']
+                if event['alarms']:
+                    reminders = offsets.parse_offsets(
+                        ' '.join(f"{minutes}m" for minutes in event['alarms']), _period(rule)
+                    )
+            except ValueError as e:
+                yield event['line'], None, str(e)
+            else:
+                yield event['line'], (name, event_datetime, reminders, rule), None
+            event = None
+            continue
+        key, _, value = content.partition(':')
+        prop, _, params = key.partition(';')
+        if prop == 'SUMMARY':
+            event['SUMMARY'] = _ics_text(value)
+        elif prop == 'DTSTART':
+            event['DTSTART'] = (params.upper(), value.strip())
+        elif prop == 'RRULE':
+            event['RRULE'] = value.strip()
+        elif prop == 'TRIGGER':
+            minutes = _ics_trigger(params.upper(), value.strip())
+            if minutes is not None:
+                event['alarms'].add(minutes)
+
+
+def import_events(repo, chat_id, data, fmt, progress=None, chunk=IMPORT_CHUNK):
+    """Parse a CSV ('csv') or iCalendar ('ics') document and insert its valid rows in chunks
+
+    Runs in a DB thread. progress(imported, failed) is called after each chunk.
+    Returns (imported, failed, first errors as (line, reason)).
+    """
+    now = datetime.now()
+    text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', errors='replace', newline='')
+    if fmt == 'ics':
+        rows = parse_ics(text, now)
+    else:
+        rows = parse_csv(text, now)
+
+    imported = failed = 0
+    errors = []
+    batch = []
+    for line, row, error in rows:
+        if error:
+            failed += 1
+            if len(errors) < MAX_ERRORS_KEPT:
+                errors.append((line, error))
+            continue
+        name, event_datetime, reminders, rule = row
+        batch.append((name, event_datetime, chat_id, reminders, rule))
+        if len(batch) >= chunk:
+            imported += len(repo.insert_jadwals(batch))
+            batch = []
+            if progress:
+                progress(imported, failed)
+    if batch:
+        imported += len(repo.insert_jadwals(batch))
+    logger.info(f"Imported {imported} jadwal for chat {chat_id} ({failed} rejected)")
+    return imported, failed, errors
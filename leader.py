@@ -0,0 +1,81 @@
+import logging
+import mysql.connector
+from db import connect_direct
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """MySQL advisory lock held on a dedicated connection; the holder is the only replica running reminders
+
+    The server drops the lock as soon as the holder's session ends, so a surviving
+    replica takes over on its next acquire() after the leader dies.
+    """
+
+    def __init__(self, name='pengingat_scheduler'):
+        self.name = name
+        self._conn = None
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except mysql.connector.Error:
+                pass
+            self._conn = None
+
+    def _query(self, sql):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(sql, (self.name,))
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def acquire(self):
+        """Try to take the lock without waiting; returns True while this process holds it"""
+        if self.is_held():
+            return True
+        self._conn = connect_direct()
+        if self._conn is None:
+            return False
+        try:
+            acquired = self._query("SELECT GET_LOCK(%s, 0)") == 1
+        except mysql.connector.Error as err:
+            logger.error(f"Error acquiring leader lock: {err}")
+            acquired = False
+        if not acquired:
+            self._close()
+        return acquired
+
+    def is_held(self):
+        if self._conn is None:
+            return False
+        try:
+            return self._query("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()") == 1
+        except mysql.connector.Error as err:
+            logger.warning(f"Lost leader lock connection: {err}")
+            self._close()
+            return False
+
+    def release(self):
+        if self._conn is None:
+            return
+        try:
+            self._query("SELECT RELEASE_LOCK(%s)")
+        except mysql.connector.Error:
+            pass
+        self._close()
+
+
+class LocalLeaderLock:
+    """Always-held lock for single-node backends, where this process is the only replica"""
+
+    def acquire(self):
+        return True
+
+    def is_held(self):
+        return True
+
+    def release(self):
+        pass
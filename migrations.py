@@ -0,0 +1,193 @@
+import sys
+
+# Ordered schema migrations: (version, description, statements). Each version runs once
+# and is recorded in schema_version; never edit an entry that has been released.
+# Statements may be a {backend: [...]} dict where MySQL and SQLite need different SQL.
+# storage.Repository.apply_migrations runs them.
+MIGRATIONS = [
+    (1, "Composite indexes for /list, /stop and the reminder window", [
+        "CREATE INDEX idx_jadwal_chat_active_event ON jadwal (chat_id, is_active, tanggal_event)",
+        "CREATE INDEX idx_jadwal_active_event ON jadwal (is_active, tanggal_event)",
+    ]),
+    (2, "Persisted conversation state and user_data", [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            handler VARCHAR(64) NOT NULL,
+            conv_key VARCHAR(64) NOT NULL,
+            state VARCHAR(64) NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY (handler, conv_key)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_state (
+            user_id BIGINT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+        """,
+    ]),
+    (3, "Archive table for expired jadwal", [
+        """
+        CREATE TABLE IF NOT EXISTS jadwal_archive (
+            id INT PRIMARY KEY,
+            nama_event VARCHAR(255) NOT NULL,
+            tanggal_event DATETIME NOT NULL,
+            chat_id BIGINT NOT NULL,
+            ingatkan_h12 TINYINT(1) DEFAULT 0,
+            ingatkan_h4 TINYINT(1) DEFAULT 0,
+            ingatkan_h1 TINYINT(1) DEFAULT 0,
+            is_active TINYINT(1) DEFAULT 1,
+            created_at TIMESTAMP NULL,
+            archived_at DATETIME NOT NULL
+        )
+        """,
+    ]),
+    (4, "Recurring jadwal", [
+        "ALTER TABLE jadwal ADD COLUMN recurrence VARCHAR(16) NULL",
+        "ALTER TABLE jadwal_archive ADD COLUMN recurrence VARCHAR(16) NULL",
+        "CREATE INDEX idx_jadwal_recurring ON jadwal (recurrence, is_active, tanggal_event)",
+    ]),
+    # One row per reminder with its fire time precomputed, replacing the ingatkan_h12/h4/h1
+    # flags (left in place, no longer read) and the reminder_log ledger: the claim lives on
+    # the row. Reminders of the current occurrences that already fired are backfilled as sent.
+    (5, "Reminders table with arbitrary offsets", {
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                jadwal_id INT NOT NULL,
+                offset_minutes INT NOT NULL,
+                fire_at DATETIME NOT NULL,
+                claimed_at DATETIME NULL,
+                sent_at DATETIME NULL,
+                PRIMARY KEY (jadwal_id, offset_minutes)
+            )
+            """,
+            "CREATE INDEX idx_reminders_fire_at ON reminders (fire_at)",
+            "INSERT IGNORE INTO reminders (jadwal_id, offset_minutes, fire_at) "
+            "SELECT id, 720, tanggal_event - INTERVAL 720 MINUTE FROM jadwal WHERE is_active = 1 AND ingatkan_h12 = 1",
+            "INSERT IGNORE INTO reminders (jadwal_id, offset_minutes, fire_at) "
+            "SELECT id, 240, tanggal_event - INTERVAL 240 MINUTE FROM jadwal WHERE is_active = 1 AND ingatkan_h4 = 1",
+            "INSERT IGNORE INTO reminders (jadwal_id, offset_minutes, fire_at) "
+            "SELECT id, 60, tanggal_event - INTERVAL 60 MINUTE FROM jadwal WHERE is_active = 1 AND ingatkan_h1 = 1",
+            "UPDATE reminders SET claimed_at = fire_at, sent_at = fire_at WHERE fire_at <= NOW()",
+            "DROP TABLE IF EXISTS reminder_log",
+        ],
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                jadwal_id INTEGER NOT NULL,
+                offset_minutes INTEGER NOT NULL,
+                fire_at DATETIME NOT NULL,
+                claimed_at DATETIME NULL,
+                sent_at DATETIME NULL,
+                PRIMARY KEY (jadwal_id, offset_minutes)
+            )
+            """,
+            "CREATE INDEX idx_reminders_fire_at ON reminders (fire_at)",
+            "INSERT OR IGNORE INTO reminders (jadwal_id, offset_minutes, fire_at) "
+            "SELECT id, 720, datetime(tanggal_event, '-720 minutes') FROM jadwal WHERE is_active = 1 AND ingatkan_h12 = 1",
+            "INSERT OR IGNORE INTO reminders (jadwal_id, offset_minutes, fire_at) "
+            "SELECT id, 240, datetime(tanggal_event, '-240 minutes') FROM jadwal WHERE is_active = 1 AND ingatkan_h4 = 1",
+            "INSERT OR IGNORE INTO reminders (jadwal_id, offset_minutes, fire_at) "
+            "SELECT id, 60, datetime(tanggal_event, '-60 minutes') FROM jadwal WHERE is_active = 1 AND ingatkan_h1 = 1",
+            "UPDATE reminders SET claimed_at = fire_at, sent_at = fire_at WHERE fire_at <= datetime('now', 'localtime')",
+            "DROP TABLE IF EXISTS reminder_log",
+        ],
+    }),
+    # Reminder messages waiting for delivery, written in the transaction that claims their
+    # reminders. Pending rows are leased by moving next_retry past the lease deadline.
+    (6, "Outbox for reminder delivery", {
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                chat_id BIGINT NOT NULL,
+                text TEXT NOT NULL,
+                reminders TEXT NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                next_retry DATETIME NOT NULL,
+                created_at DATETIME NOT NULL,
+                sent_at DATETIME NULL
+            )
+            """,
+            "CREATE INDEX idx_outbox_status_retry ON outbox (status, next_retry)",
+            "CREATE INDEX idx_outbox_created ON outbox (created_at)",
+        ],
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                reminders TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_retry DATETIME NOT NULL,
+                created_at DATETIME NOT NULL,
+                sent_at DATETIME NULL
+            )
+            """,
+            "CREATE INDEX idx_outbox_status_retry ON outbox (status, next_retry)",
+            "CREATE INDEX idx_outbox_created ON outbox (created_at)",
+        ],
+    }),
+    # MySQL reads the ids of a batch insert back by this token; SQLite uses lastrowid
+    (7, "Insert batch token on jadwal", {
+        'mysql': [
+            "ALTER TABLE jadwal ADD COLUMN batch_token CHAR(32) NULL",
+            "CREATE INDEX idx_jadwal_batch_token ON jadwal (batch_token)",
+        ],
+        'sqlite': [],
+    }),
+]
+
+# Migrations of several replicas starting at once are serialized with this advisory lock
+MIGRATION_LOCK = 'pengingat_migrations'
+
+
+def hot_queries(now):
+    """(name, sql, params) of the queries that must use an index, for explain_full_scans"""
+    from datetime import timedelta
+    import storage
+
+    return [
+        ('active jadwal', storage.ACTIVE_JADWAL_QUERY, (0, now, 10)),
+        ('active jadwal page', storage.ACTIVE_JADWAL_AFTER_QUERY, (0, now, now, now, 0, 10)),
+        ('upcoming reminders', storage.UPCOMING_REMINDERS_QUERY, (now, now + timedelta(hours=6))),
+        ('missed reminders', storage.MISSED_REMINDERS_QUERY, (now - timedelta(hours=6), now, 1000)),
+        ('due outbox', storage.DUE_OUTBOX_QUERY, (now, 50)),
+    ]
+
+
+if __name__ == '__main__':
+    # `python migrations.py --explain` creates or migrates the configured database, then fails
+    # if any hot query needs a full table scan. Run it against a database with realistic row
+    # counts: on a near-empty table MySQL may prefer a scan over the index.
+    # tests/test_migrations.py runs the same check on a temporary SQLite database.
+    from datetime import datetime
+    from dotenv import load_dotenv
+    import storage
+    from db import DatabaseUnavailable
+
+    load_dotenv()
+    repo = storage.create_repository()
+    # The base tables first, so a fresh database works too
+    if not repo.init_schema():
+        sys.exit("Cannot initialize database")
+    conn = repo.connect()
+    if conn is None:
+        sys.exit("Cannot connect to database")
+    try:
+        print(f"Schema version: {repo.apply_migrations(conn)}")
+    finally:
+        repo.release(conn)
+    if '--explain' in sys.argv:
+        try:
+            failed = repo.explain_full_scans(hot_queries(datetime.now()))
+        except DatabaseUnavailable:
+            sys.exit("Cannot connect to database")
+        if failed:
+            sys.exit(f"Full table scans in: {', '.join(failed)}")
+        print("No full table scans in hot queries")
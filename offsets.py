@@ -0,0 +1,77 @@
+import re
+
+# Reminder offsets are minutes before the event, one reminders row each
+MAX_OFFSETS = 5
+MAX_OFFSET_MINUTES = 30 * 24 * 60
+
+# The classic H-12/H-4/H-1 reminders; they keep their own message texts and metric labels
+PRESET_KINDS = {720: 'h12', 240: 'h4', 60: 'h1'}
+
+# /tambah buttons and import keywords -> offsets
+PRESET_CHOICES = {
+    'h12': [720],
+    'h4': [240],
+    'h1': [60],
+    'h12_h4': [720, 240],
+    'h4_h1': [240, 60],
+    'all': [720, 240, 60],
+    'none': [],
+    'semua': [720, 240, 60],
+    'tidak': [],
+}
+
+_UNITS = {
+    'm': 1, 'mnt': 1, 'menit': 1, 'min': 1,
+    'j': 60, 'h': 60, 'jam': 60,
+    'd': 1440, 'hari': 1440,
+    'mg': 10080, 'w': 10080, 'minggu': 10080,
+}
+_TOKEN = re.compile(r'(\d+)\s*([a-z]+)')
+
+
+def parse_offsets(text, period=None):
+    """'1 hari, 30 menit', '2j 15m', 'h12 h1', ... -> sorted distinct minutes; raises ValueError
+
+    period is the shortest gap in minutes between occurrences of a recurring jadwal;
+    a reminder that far ahead would fall before the previous occurrence and never fire.
+    """
+    text = text.lower().strip()
+    minutes = set()
+    rest = text
+    for word in re.split(r'[\s,&]+', text):
+        if word.replace('-', '') in PRESET_CHOICES:
+            minutes.update(PRESET_CHOICES[word.replace('-', '')])
+            rest = rest.replace(word, ' ', 1)
+    for amount, unit in _TOKEN.findall(rest):
+        if unit not in _UNITS:
+            raise ValueError(f"satuan tidak dikenal: {unit}")
+        minutes.add(int(amount) * _UNITS[unit])
+    if _TOKEN.sub('', rest).replace(',', ' ').replace('&', ' ').strip():
+        raise ValueError(f"format pengingat tidak valid: {text}")
+    if any(m <= 0 or m > MAX_OFFSET_MINUTES for m in minutes):
+        raise ValueError("pengingat harus antara 1 menit dan 30 hari sebelum event")
+    if len(minutes) > MAX_OFFSETS:
+        raise ValueError(f"maksimal {MAX_OFFSETS} pengingat per jadwal")
+    if period is not None and any(m >= period for m in minutes):
+        raise ValueError(f"pengingat jadwal berulang harus kurang dari {format_offset(period)} sebelum event")
+    return sorted(minutes, reverse=True)
+
+
+def format_offset(minutes):
+    """720 -> '12 jam', 1470 -> '1 hari 30 menit'"""
+    parts = []
+    for size, name in ((1440, 'hari'), (60, 'jam'), (1, 'menit')):
+        if minutes >= size:
+            parts.append(f"{minutes // size} {name}")
+            minutes %= size
+    return ' '.join(parts)
+
+
+def offset_label(minutes):
+    kind = PRESET_KINDS.get(minutes)
+    return kind.upper().replace('H', 'H-') + " jam" if kind else f"{format_offset(minutes)} sebelumnya"
+
+
+def offset_kind(minutes):
+    # Metric label: presets by name, everything else pooled to keep cardinality bounded
+    return PRESET_KINDS.get(minutes, 'custom')
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from db import run_db
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 60
+# First retry delay, doubled on every further attempt
+RETRY_BASE_SECONDS = 5
+# How long a stopping worker waits for its batch in flight
+STOP_DRAIN_SECONDS = 10
+
+OUTBOX_TOTAL = Counter(
+    'pengingat_outbox_total', "Outbox delivery attempts by outcome (sent, retried, failed)", labels=('status',)
+)
+
+
+class OutboxRelay:
+    """Drains the outbox table into a DeliveryQueue
+
+    Each worker leases a batch of due messages, hands them to the queue and records
+    the outcomes once the batch is through; more workers keep more batches in flight.
+    Messages stay in the outbox until they are sent or out of attempts, so after a
+    crash delivery resumes with whatever was not confirmed (a message sent just
+    before a crash can go out twice). On a clean stop the batch in flight is recorded.
+    """
+
+    def __init__(self, repo, queue, workers=1, batch_size=50, poll_interval=5, lease=LEASE_SECONDS,
+                 max_attempts=MAX_ATTEMPTS, on_finish=None):
+        self.repo = repo
+        self.queue = queue
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease)
+        self.max_attempts = max_attempts
+        # on_finish(message, status) is called after each attempt, status as in OUTBOX_TOTAL
+        self.on_finish = on_finish
+        self._loop = None
+        self._wakeup = None
+
+    def notify(self):
+        """Wake the workers after new messages were written; safe to call from any thread"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _outcome(self, message, sent):
+        if sent:
+            return 'sent', None
+        if message['attempts'] >= self.max_attempts:
+            return 'failed', None
+        return 'retried', datetime.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (message['attempts'] - 1))
+
+    async def _record(self, results):
+        # results: (message, sent) pairs, written in one transaction
+        outcomes = [(message, *self._outcome(message, sent)) for message, sent in results]
+        try:
+            await run_db(
+                self.repo.finish_outbox,
+                [(message, status == 'sent', retry_at) for message, status, retry_at in outcomes]
+            )
+        except Exception as e:
+            # The leases run out and the messages are retried
+            logger.error(f"Cannot record delivery of {len(outcomes)} outbox messages: {e}")
+            return
+        for message, status, _ in outcomes:
+            OUTBOX_TOTAL.inc(status=status)
+            if status == 'failed':
+                logger.error(f"Giving up on outbox message {message['id']} after {message['attempts']} attempts")
+            if self.on_finish is not None:
+                self.on_finish(message, status)
+
+    async def _deliver(self, messages):
+        # Queue a leased batch, then record all outcomes together
+        loop = asyncio.get_running_loop()
+        done = []
+        try:
+            for message in messages:
+                future = loop.create_future()
+                done.append(future)
+
+                async def on_done(sent, future=future):
+                    if not future.done():
+                        future.set_result(sent)
+
+                # Reminder texts are Markdown
+                await self.queue.put(message['chat_id'], message['text'], on_done=on_done, parse_mode='Markdown')
+            await asyncio.wait(done)
+        except asyncio.CancelledError:
+            # Stopping: record what the queue still delivers while it drains, so it is not resent
+            if done:
+                await asyncio.wait(done, timeout=STOP_DRAIN_SECONDS)
+            await self._record([(m, f.result()) for m, f in zip(messages, done) if f.done()])
+            raise
+        await self._record([(m, f.result()) for m, f in zip(messages, done)])
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                messages = await run_db(self.repo.lease_outbox, self.batch_size, self.lease)
+            except Exception as e:
+                logger.error(f"Cannot lease outbox messages: {e}")
+                messages = []
+            if messages:
+                await self._deliver(messages)
+            if len(messages) == self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+from datetime import date, datetime, timedelta
+from telegram.ext import BasePersistence, PersistenceInput
+from db import run_db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_WRITES = metrics.Counter(
+    'pengingat_persistence_writes_total', "Conversation and user_data rows written per batch", labels=('kind',)
+)
+
+
+def _encode(value):
+    # user_data holds the /tambah answers, including date and datetime objects
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f"Cannot persist {type(value).__name__}")
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+class RepositoryPersistence(BasePersistence):
+    """Keeps ConversationHandler states and user_data in the bot's database
+
+    The Application hands over changes every update_interval seconds; each round is
+    written as one batch, so handlers never wait on a persistence write. Conversations
+    idle longer than `timeout` are dropped when the state is loaded at startup.
+    """
+
+    def __init__(self, repo, update_interval=5, timeout=timedelta(hours=1)):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.repo = repo
+        self.timeout = timeout
+        self._conversations = {}
+        self._users = {}
+        self._flush_task = None
+
+    def _cutoff(self):
+        return datetime.now() - self.timeout
+
+    async def get_conversations(self, name):
+        rows = await run_db(self.repo.load_conversations, name, self._cutoff())
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def get_user_data(self):
+        rows = await run_db(self.repo.load_user_states, self._cutoff())
+        return {user_id: json.loads(data, object_hook=_decode) for user_id, data in rows}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_conversation(self, name, key, new_state):
+        self._conversations[(name, json.dumps(list(key)))] = (
+            None if new_state is None else json.dumps(new_state)
+        )
+        await self._write()
+
+    async def update_user_data(self, user_id, data):
+        # An emptied user_data (finished or cancelled conversation) removes the row
+        self._users[user_id] = json.dumps(data, default=_encode) if data else None
+        await self._write()
+
+    async def drop_user_data(self, user_id):
+        self._users[user_id] = None
+        await self._write()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def _write(self):
+        # All update_* calls of one persistence round share a single batch write
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._write_pending())
+        await asyncio.shield(self._flush_task)
+
+    async def _write_pending(self):
+        while self._conversations or self._users:
+            conversations, self._conversations = self._conversations, {}
+            users, self._users = self._users, {}
+            try:
+                await run_db(
+                    self.repo.save_states,
+                    [(name, key, state) for (name, key), state in conversations.items()],
+                    list(users.items())
+                )
+            except Exception as e:
+                # Keep the batch for the next round unless newer values replaced it meanwhile
+                logger.error(f"Error saving conversation state: {e}")
+                for key, value in conversations.items():
+                    self._conversations.setdefault(key, value)
+                for key, value in users.items():
+                    self._users.setdefault(key, value)
+                return
+            PERSISTENCE_WRITES.inc(len(conversations), kind='conversation')
+            PERSISTENCE_WRITES.inc(len(users), kind='user_data')
+
+    async def flush(self):
+        await self._write()
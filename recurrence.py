@@ -0,0 +1,66 @@
+import calendar
+from datetime import timedelta
+
+# A recurring jadwal is one row whose tanggal_event is its next occurrence; the
+# rule in jadwal.recurrence says how to step to the one after. Monthly rules keep
+# the day of month of the first occurrence ('monthly:31') so short months do not
+# shift the series.
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+RECURRENCE_LABELS = {
+    'daily': "Setiap hari",
+    'weekly': "Setiap minggu",
+    'monthly': "Setiap bulan",
+}
+
+_PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+
+
+def make_rule(frequency, first):
+    """Rule stored in jadwal.recurrence for a series starting at `first`"""
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown recurrence: {frequency}")
+    return f"monthly:{first.day}" if frequency == 'monthly' else frequency
+
+
+def shortest_period(rule):
+    """Least time between two occurrences; monthly series step at least 28 days"""
+    return _PERIODS.get(frequency(rule), timedelta(days=28))
+
+
+def frequency(rule):
+    return rule.split(':', 1)[0]
+
+
+def label(rule):
+    return RECURRENCE_LABELS[frequency(rule)]
+
+
+def _add_month(when, day):
+    year, month = (when.year + 1, 1) if when.month == 12 else (when.year, when.month + 1)
+    return when.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(rule, when, after):
+    """First occurrence of the series through `when` that is later than `after`"""
+    if when > after:
+        return when
+    freq = frequency(rule)
+    if freq in _PERIODS:
+        period = _PERIODS[freq]
+        return when + period * ((after - when) // period + 1)
+    day = int(rule.split(':', 1)[1])
+    while when <= after:
+        when = _add_month(when, day)
+    return when
+
+
+def occurrences(rule, when, count):
+    """`count` consecutive occurrences starting at `when`"""
+    result = [when]
+    while len(result) < count:
+        result.append(next_occurrence(rule, result[-1], result[-1]))
+    return result
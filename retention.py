@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from db import run_db
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ROWS = Counter(
+    'pengingat_retention_rows_total', "Expired rows removed by the retention job", labels=('action',)
+)
+RETENTION_BATCH_SECONDS = Histogram(
+    'pengingat_retention_batch_seconds', "Duration of one retention batch (transaction time)"
+)
+
+
+class RetentionJob:
+    """Periodically archives or deletes expired jadwal (and old outbox messages) in small batches
+
+    Each batch is its own short transaction and batches are spaced by `pause`
+    seconds, so row locks are held briefly and handlers keep their DB threads.
+    """
+
+    def __init__(self, repo, days=30, archive=True, batch_size=500, interval=3600, pause=0.5):
+        self.repo = repo
+        self.retention = timedelta(days=days)
+        self.archive = archive
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+
+    async def _batches(self, action, expire, cutoff, **kwargs):
+        total = 0
+        while True:
+            with RETENTION_BATCH_SECONDS.time():
+                count = await run_db(expire, cutoff, self.batch_size, **kwargs)
+            RETENTION_ROWS.inc(count, action=action)
+            total += count
+            if count < self.batch_size:
+                return total
+            await asyncio.sleep(self.pause)
+
+    async def run_once(self):
+        """Expire everything past the retention period; returns the number of jadwal removed
+
+        Delivered and failed outbox messages past the period are purged as well.
+        """
+        cutoff = datetime.now() - self.retention
+        action = 'archived' if self.archive else 'deleted'
+        total = await self._batches(action, self.repo.expire_jadwals, cutoff, archive=self.archive)
+        if total:
+            logger.info(f"Retention: {action} {total} jadwal older than {cutoff:%d-%m-%Y %H:%M}")
+        purged = await self._batches('outbox_purged', self.repo.purge_outbox, cutoff)
+        if purged:
+            logger.info(f"Retention: purged {purged} outbox messages older than {cutoff:%d-%m-%Y %H:%M}")
+        return total
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Retention job failed: {e}")
+            await asyncio.sleep(self.interval)
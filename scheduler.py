@@ -0,0 +1,247 @@
+import asyncio
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from db import run_db
+from metrics import Counter, Histogram, profiled
+from offsets import offset_kind
+
+logger = logging.getLogger(__name__)
+
+# Retry delay while the database is unavailable, doubled from 1 second up to this
+RELOAD_RETRY_SECONDS = 15
+# Missed reminders loaded per catch-up pass
+CATCH_UP_BATCH = 1000
+
+SCHEDULER_LAG_SECONDS = Histogram(
+    'pengingat_scheduler_lag_seconds', "Actual minus intended reminder fire time", labels=('kind',)
+)
+DIGEST_REMINDERS = Histogram(
+    'pengingat_digest_reminders', "Reminders dispatched together for one chat", buckets=(1, 2, 3, 5, 10, 20, 50)
+)
+CATCH_UP_REMINDERS = Counter(
+    'pengingat_catch_up_reminders_total', "Reminders found after their fire time passed unsent"
+)
+
+
+class ReminderScheduler:
+    """Keeps upcoming reminder fire times in a heap and sleeps until the next one is due"""
+
+    def __init__(self, load_upcoming, horizon=timedelta(hours=6), refresh_seconds=0, digest_window=None,
+                 load_missed=None, catch_up=timedelta(hours=6)):
+        # load_upcoming(start, end) returns reminder rows (jadwal columns plus offset_minutes
+        # and fire_at) firing in [start, end), or None when the database is unavailable
+        self._load_upcoming = load_upcoming
+        self._horizon = horizon
+        # load_missed(since, until, limit) returns unclaimed rows like load_upcoming, oldest
+        # first; reminders that fired unsent during an outage are looked up at most
+        # `catch_up` back. Without it, whatever was missed stays missed.
+        self._load_missed = load_missed
+        self._catch_up = catch_up
+        self._missed_since = None
+        # Digest mode: a chat's reminders firing within this many seconds of a due one go
+        # out together, early by up to the window; None dispatches every reminder alone
+        self._digest = timedelta(seconds=digest_window) if digest_window is not None else None
+        # Periodic rebuild of the window, to pick up rows changed by other replicas
+        self._refresh = timedelta(seconds=refresh_seconds) if refresh_seconds else None
+        self._refreshed_at = None
+        self._heap = []
+        # (jadwal id, offset_minutes) -> reminder row, for reminders still to fire
+        self._pending = {}
+        self._loaded_until = None
+        # Last time _pop_due ran up to; survives reset() so a rebuilt window starts there
+        # and nothing firing between the last pass and the rebuild is skipped
+        self._processed_until = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+
+    def _push(self, reminder, now):
+        # Caller must hold self._lock
+        fire_at = reminder['fire_at']
+        key = (reminder['id'], reminder['offset_minutes'])
+        if fire_at < now or fire_at >= self._loaded_until or key in self._pending:
+            return False
+        heapq.heappush(self._heap, (fire_at, key))
+        self._pending[key] = reminder
+        return True
+
+    def _notify(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def schedule_reminders(self, reminders):
+        """Register the reminders of a newly saved jadwal; safe to call from any thread"""
+        with self._lock:
+            if self._loaded_until is None:
+                return
+            now = datetime.now()
+            pushed = [self._push(reminder, now) for reminder in reminders]
+        if any(pushed):
+            self._notify()
+
+    def cancel_jadwal(self, jadwal_id):
+        """Drop all pending reminders of a jadwal; safe to call from any thread"""
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == jadwal_id]:
+                del self._pending[key]
+
+    def reset(self):
+        """Forget all scheduled reminders; the next pass reloads them from the last processed time"""
+        with self._lock:
+            self._heap = []
+            self._pending = {}
+            self._loaded_until = None
+
+    def refresh(self):
+        """Rebuild the window on the next pass, e.g. after a bulk insert; safe to call from any thread"""
+        self.reset()
+        self._notify()
+
+    async def _reload(self, now):
+        # After a reset, start where the last pass stopped; the claim on the reminders
+        # row drops anything that was already sent
+        start = self._loaded_until or self._processed_until or now - timedelta(seconds=1)
+        end = now + self._horizon
+        reminders = await run_db(self._load_upcoming, start, end)
+        if reminders is None:
+            return False
+        with self._lock:
+            self._loaded_until = end
+            for reminder in reminders:
+                self._push(reminder, start)
+        self._refreshed_at = now
+        logger.info(f"Loaded {len(reminders)} upcoming reminders, scheduled until {end:%d-%m-%Y %H:%M}")
+        return True
+
+    def _take(self, key, now, groups):
+        # Caller must hold self._lock
+        reminder = self._pending.pop(key)
+        if reminder['fire_at'] <= now:
+            SCHEDULER_LAG_SECONDS.observe((now - reminder['fire_at']).total_seconds(), kind=offset_kind(key[1]))
+        if self._digest is None:
+            groups.append([reminder])
+        else:
+            groups.setdefault(reminder['chat_id'], []).append(reminder)
+
+    def _pop_due(self, now):
+        """Due reminders as lists dispatched together: one per chat in digest mode, else singletons"""
+        groups = [] if self._digest is None else {}
+        early = []
+        with self._lock:
+            until = now + (self._digest or timedelta(0))
+            while self._heap and self._heap[0][0] <= until:
+                fire_at, key = heapq.heappop(self._heap)
+                reminder = self._pending.get(key)
+                if reminder is None or reminder['fire_at'] != fire_at:
+                    continue  # cancelled, or replaced by a later push
+                if fire_at <= now:
+                    self._take(key, now, groups)
+                else:
+                    early.append((fire_at, key))
+            # Not yet due: joins its chat's digest if one is going out, otherwise waits
+            for fire_at, key in early:
+                if self._pending[key]['chat_id'] in groups:
+                    self._take(key, now, groups)
+                else:
+                    heapq.heappush(self._heap, (fire_at, key))
+        if self._digest is None:
+            return groups
+        for group in groups.values():
+            DIGEST_REMINDERS.observe(len(group))
+        return list(groups.values())
+
+    def _seconds_until_next(self, now):
+        with self._lock:
+            next_at = self._loaded_until
+            if next_at is None:
+                return 0  # refresh() asked for a reload
+            if self._refresh:
+                next_at = min(next_at, self._refreshed_at + self._refresh)
+            while self._heap and self._heap[0][1] not in self._pending:
+                heapq.heappop(self._heap)
+            if self._heap:
+                next_at = min(next_at, self._heap[0][0])
+        return max((next_at - now).total_seconds(), 0)
+
+    def _missed(self, since):
+        if self._load_missed is not None and (self._missed_since is None or since < self._missed_since):
+            self._missed_since = since
+
+    async def _catch_up_pass(self, now, dispatch_missed):
+        # One bounded batch of what fired unsent since _missed_since, one dispatch per chat;
+        # False while the database is still unavailable
+        since = max(self._missed_since, now - self._catch_up)
+        reminders = await run_db(self._load_missed, since, now, CATCH_UP_BATCH)
+        if reminders is None:
+            return False
+        if reminders:
+            chats = {}
+            for reminder in reminders:
+                chats.setdefault(reminder['chat_id'], []).append(reminder)
+            logger.warning(f"Catching up {len(reminders)} missed reminders for {len(chats)} chats "
+                           f"since {since:%d-%m-%Y %H:%M}")
+            CATCH_UP_REMINDERS.inc(len(reminders))
+            with profiled('catch-up pass'):
+                results = await asyncio.gather(*(dispatch_missed(group) for group in chats.values()))
+            if False in results:
+                return False
+        # Rows sharing the last fire time are read again; the claimed ones drop out
+        self._missed_since = reminders[-1]['fire_at'] if len(reminders) == CATCH_UP_BATCH else None
+        return True
+
+    async def run(self, dispatch, dispatch_missed=None):
+        """Dispatch reminders at their fire time; dispatch(reminders) is awaited per group from _pop_due
+
+        dispatch returns False when the database was unavailable and the reminders were not
+        handed over. Those, and reminders whose fire time passed while nothing was running
+        or the window could not be loaded, are later passed per chat to dispatch_missed.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        retry = 1
+        # Reminders from before this run are the catch-up pass's business
+        self._processed_until = None
+        if dispatch_missed is not None:
+            # Whatever fired before this scheduler took over
+            self._missed(datetime.now() - self._catch_up)
+
+        while True:
+            now = datetime.now()
+            if self._refresh and self._refreshed_at and now >= self._refreshed_at + self._refresh:
+                self.reset()
+            if self._loaded_until is None or now >= self._loaded_until:
+                if not await self._reload(now):
+                    self._missed(self._loaded_until or now)
+                    logger.error(f"Cannot load upcoming reminders, retrying in {retry}s")
+                    await asyncio.sleep(retry)
+                    retry = min(retry * 2, RELOAD_RETRY_SECONDS)
+                    continue
+
+            due = self._pop_due(now)
+            self._processed_until = now
+            if due:
+                with profiled('reminder pass'):
+                    results = await asyncio.gather(*(dispatch(group) for group in due))
+                for group, handed_over in zip(due, results):
+                    if handed_over is False:
+                        self._missed(min(reminder['fire_at'] for reminder in group))
+
+            # After the due ones went out, so everything left unclaimed up to now was missed
+            if self._missed_since is not None and dispatch_missed is not None:
+                if not await self._catch_up_pass(now, dispatch_missed):
+                    logger.error(f"Cannot catch up missed reminders, retrying in {retry}s")
+                    await asyncio.sleep(retry)
+                    retry = min(retry * 2, RELOAD_RETRY_SECONDS)
+                    continue
+                if self._missed_since is not None:
+                    continue  # more than one batch was missed
+            retry = 1
+
+            self._wakeup.clear()
+            timeout = self._seconds_until_next(datetime.now())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
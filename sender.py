@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages/second overall and 1 message/second per chat
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+MAX_ATTEMPTS = 5
+STATS_INTERVAL = 60
+
+SEND_QUEUE_DEPTH = Gauge('pengingat_send_queue_depth', "Messages waiting in the delivery queue")
+MESSAGES_TOTAL = Counter(
+    'pengingat_messages_total', "Outbound messages by outcome (sent, failed, retried)", labels=('status',)
+)
+
+
+class TokenBucket:
+    """Async token bucket: acquire() waits until a token is available"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class DeliveryQueue:
+    """Outbound message queue drained by a bounded number of workers under Telegram's rate limits"""
+
+    def __init__(self, bot, concurrency=8, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self._global = TokenBucket(global_rate)
+        self._chats = {}
+        self._queue = asyncio.Queue()
+        self._workers = []
+        self._paused_until = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._report()))
+
+    async def stop(self, drain_timeout=0):
+        """Give queued messages up to drain_timeout seconds to go out, then stop the workers"""
+        if drain_timeout and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Stopping with {self._queue.qsize()} messages still queued")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        # Report whatever could not be delivered so callers can release their claims
+        while not self._queue.empty():
+            _, _, _, on_done = self._queue.get_nowait()
+            if on_done is not None:
+                try:
+                    await on_done(False)
+                except Exception as e:
+                    logger.error(f"Delivery callback failed: {e}")
+
+    async def put(self, chat_id, text, on_done=None, **kwargs):
+        """Queue a message; on_done(sent) is awaited once it was delivered or given up on"""
+        await self._queue.put((chat_id, text, kwargs, on_done))
+        SEND_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+        }
+
+    async def _acquire(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Drop buckets of chats that have been quiet long enough to be full again
+            if len(self._chats) > 10000:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate)
+        await bucket.acquire()
+
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._global.acquire()
+
+    async def _send(self, chat_id, text, kwargs):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self._acquire(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return True
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so pause every worker
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                logger.warning(f"Flood control hit, pausing delivery for {retry_after}s")
+            except (BadRequest, Forbidden) as e:
+                logger.error(f"Message to {chat_id} rejected: {e}")
+                return False
+            except NetworkError as e:
+                backoff = min(2 ** (attempt - 1), 30)
+                logger.warning(f"Network error sending to {chat_id} (attempt {attempt}): {e}, retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+            self.retried += 1
+            MESSAGES_TOTAL.inc(status='retried')
+        return False
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, on_done = await self._queue.get()
+            SEND_QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                sent = await self._send(chat_id, text, kwargs)
+            except Exception as e:
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                sent = False
+            if sent:
+                self.sent += 1
+            else:
+                self.failed += 1
+            MESSAGES_TOTAL.inc(status='sent' if sent else 'failed')
+            try:
+                if on_done is not None:
+                    await on_done(sent)
+            except Exception as e:
+                logger.error(f"Delivery callback failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _report(self):
+        last_sent = self.sent
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            stats = self.stats()
+            if stats['sent'] == last_sent and not stats['queue_depth']:
+                continue
+            rate = (stats['sent'] - last_sent) / STATS_INTERVAL
+            last_sent = stats['sent']
+            logger.info(
+                f"Delivery stats: {rate:.2f} msg/s, queue depth {stats['queue_depth']}, "
+                f"sent {stats['sent']}, failed {stats['failed']}, retried {stats['retried']}"
+            )
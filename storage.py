@@ -0,0 +1,854 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+import mysql.connector
+from mysql.connector import errorcode
+from db import get_db_connection, DatabaseUnavailable
+from leader import LeaderLock, LocalLeaderLock
+from migrations import MIGRATIONS, MIGRATION_LOCK
+from recurrence import next_occurrence
+
+logger = logging.getLogger(__name__)
+
+# Hot-path queries, written with %s placeholders (translated for SQLite). Plain range
+# predicates on tanggal_event let them use the (chat_id, is_active, tanggal_event) and
+# (is_active, tanggal_event) indexes; `python migrations.py --explain` checks for full scans.
+_ACTIVE_JADWAL_SELECT = (
+    "SELECT id, nama_event, tanggal_event, is_active, recurrence "
+    "FROM jadwal WHERE chat_id = %s AND is_active = 1 AND tanggal_event > %s"
+)
+# Keyset pages of a chat's upcoming jadwal in (tanggal_event, id) order: the first page,
+# the page after a row and the page before a row (read backwards, then reversed)
+ACTIVE_JADWAL_QUERY = _ACTIVE_JADWAL_SELECT + " ORDER BY tanggal_event, id LIMIT %s"
+ACTIVE_JADWAL_AFTER_QUERY = (
+    _ACTIVE_JADWAL_SELECT +
+    " AND (tanggal_event > %s OR (tanggal_event = %s AND id > %s)) ORDER BY tanggal_event, id LIMIT %s"
+)
+ACTIVE_JADWAL_BEFORE_QUERY = (
+    _ACTIVE_JADWAL_SELECT +
+    " AND (tanggal_event < %s OR (tanggal_event = %s AND id < %s)) ORDER BY tanggal_event DESC, id DESC LIMIT %s"
+)
+# Every reminder row firing inside the window, one range scan on reminders.fire_at however
+# many offsets a jadwal has; claimed rows (sent or in flight) are left out
+UPCOMING_REMINDERS_QUERY = (
+    "SELECT r.offset_minutes, r.fire_at, j.id, j.nama_event, j.tanggal_event, j.chat_id, j.recurrence, u.name "
+    "FROM reminders r JOIN jadwal j ON j.id = r.jadwal_id LEFT JOIN users u ON u.chat_id = j.chat_id "
+    "WHERE r.fire_at >= %s AND r.fire_at < %s AND r.claimed_at IS NULL AND j.is_active = 1 "
+    "ORDER BY r.fire_at"
+)
+# Reminders that should have fired while nothing was sending them, oldest first
+MISSED_REMINDERS_QUERY = UPCOMING_REMINDERS_QUERY + " LIMIT %s"
+# Oldest outbox messages ready for (re)delivery, on the (status, next_retry) index
+DUE_OUTBOX_QUERY = (
+    "SELECT id, chat_id, text, reminders, attempts FROM outbox "
+    "WHERE status = 'pending' AND next_retry <= %s ORDER BY next_retry LIMIT %s"
+)
+
+
+def _reminder_row(jadwal_id, minutes, event_datetime, now):
+    # (jadwal_id, offset_minutes, fire_at, claimed_at, sent_at); a fire time that has
+    # already passed will never fire, so it is recorded as done rather than left unclaimed
+    fire_at = event_datetime - timedelta(minutes=minutes)
+    done = fire_at if fire_at <= now else None
+    return jadwal_id, minutes, fire_at, done, done
+
+
+class Repository:
+    """Data access shared by all backends; subclasses supply connections and dialect SQL"""
+
+    backend = None
+    placeholder = '%s'
+
+    # Dialect-specific statements
+    SCHEMA = ()
+    UPSERT_USER = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def release(self, conn):
+        conn.close()
+
+    def cursor(self, conn, dictionary=False):
+        return conn.cursor(dictionary=dictionary)
+
+    def sql(self, query):
+        return query if self.placeholder == '%s' else query.replace('%s', self.placeholder)
+
+    def _require_connection(self):
+        conn = self.connect()
+        if conn is None:
+            raise DatabaseUnavailable("Cannot connect to database")
+        return conn
+
+    def leader_lock(self):
+        return LocalLeaderLock()
+
+    def ping(self):
+        conn = self.connect()
+        if conn is None:
+            return False
+        try:
+            cursor = self.cursor(conn)
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.error(f"Database health check failed: {e}")
+            return False
+        finally:
+            self.release(conn)
+
+    # Schema
+    def init_schema(self):
+        conn = self.connect()
+        if conn is None:
+            logger.error("Cannot connect to database for initialization")
+            return False
+
+        cursor = self.cursor(conn)
+        try:
+            for statement in self.SCHEMA:
+                cursor.execute(statement)
+            conn.commit()
+            version = self.apply_migrations(conn)
+            logger.info(f"Database tables initialized successfully (schema version {version})")
+            return True
+        except Exception as e:
+            logger.error(f"Error initializing database: {e}")
+            return False
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def _lock_migrations(self, cursor):
+        pass
+
+    def _unlock_migrations(self, cursor):
+        pass
+
+    def _is_duplicate_index(self, err):
+        return False
+
+    def apply_migrations(self, conn):
+        """Apply pending migrations from migrations.MIGRATIONS; returns the resulting schema version"""
+        cursor = self.cursor(conn)
+        try:
+            self._lock_migrations(cursor)
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INT PRIMARY KEY,
+                        description VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                current = cursor.fetchone()[0]
+
+                for version, description, statements in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    if isinstance(statements, dict):
+                        statements = statements[self.backend]
+                    logger.info(f"Applying migration {version}: {description}")
+                    for statement in statements:
+                        try:
+                            cursor.execute(statement)
+                        except Exception as err:
+                            # Index created by hand or by an interrupted run: treat as applied
+                            if not self._is_duplicate_index(err):
+                                raise
+                    cursor.execute(
+                        self.sql("INSERT INTO schema_version (version, description) VALUES (%s, %s)"),
+                        (version, description)
+                    )
+                    conn.commit()
+                    current = version
+                return current
+            finally:
+                self._unlock_migrations(cursor)
+        finally:
+            cursor.close()
+
+    def explain_full_scans(self, queries):
+        """Run EXPLAIN on (name, sql, params) queries; returns the names that scan a whole table"""
+        raise NotImplementedError
+
+    # Users
+    def get_user_name(self, chat_id):
+        # None means not registered; an unreachable database raises DatabaseUnavailable
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            cursor.execute(self.sql("SELECT name FROM users WHERE chat_id = %s"), (chat_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def save_user_name(self, chat_id, name):
+        return self.save_user_names([(chat_id, name)])
+
+    def save_user_names(self, users):
+        # users: iterable of (chat_id, name)
+        conn = self.connect()
+        if conn is None:
+            return False
+
+        cursor = self.cursor(conn)
+        try:
+            cursor.executemany(self.sql(self.UPSERT_USER), list(users))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving user name: {e}")
+            return False
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    # Jadwal
+    def insert_jadwal(self, event_name, event_datetime, chat_id, offsets, recurrence=None):
+        # offsets: minutes before the event, one reminders row each; returns the jadwal id
+        return self.insert_jadwals([(event_name, event_datetime, chat_id, offsets, recurrence)])[0]
+
+    def insert_jadwals(self, rows):
+        """Insert (nama_event, tanggal_event, chat_id, offsets[, recurrence]) rows in one transaction
+
+        Returns the new jadwal ids. The jadwal rows go in through _insert_jadwal_rows, which
+        knows how the backend reports their ids, then the reminders go in as one batch.
+        Reminders already past are stored as sent, like the migration 5 backfill, so a
+        catch-up pass does not report them as missed.
+        """
+        rows = [(event_name, event_datetime, chat_id, offsets, rule[0] if rule else None)
+                for event_name, event_datetime, chat_id, offsets, *rule in rows]
+        if not rows:
+            return []
+        now = datetime.now()
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            jadwal_ids = self._insert_jadwal_rows(
+                cursor, [(event_name, event_datetime, chat_id, rule) for event_name, event_datetime, chat_id, _, rule in rows]
+            )
+            reminders = []
+            for (_, event_datetime, _, offsets, _), jadwal_id in zip(rows, jadwal_ids):
+                reminders += [_reminder_row(jadwal_id, minutes, event_datetime, now) for minutes in offsets]
+            if reminders:
+                cursor.executemany(
+                    self.sql("INSERT INTO reminders (jadwal_id, offset_minutes, fire_at, claimed_at, sent_at) "
+                             "VALUES (%s, %s, %s, %s, %s)"),
+                    reminders
+                )
+            conn.commit()
+            return jadwal_ids
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def _insert_jadwal_rows(self, cursor, rows):
+        # (nama_event, tanggal_event, chat_id, recurrence) rows -> their ids, in row order.
+        # One statement per row with its lastrowid: cheap for an embedded database.
+        ids = []
+        for row in rows:
+            cursor.execute(
+                self.sql("INSERT INTO jadwal (nama_event, tanggal_event, chat_id, recurrence) VALUES (%s, %s, %s, %s)"),
+                row
+            )
+            ids.append(cursor.lastrowid)
+        return ids
+
+    def get_active_jadwals_page(self, chat_id, limit, after=None, before=None):
+        """One page of upcoming active jadwal; after/before are (tanggal_event, id) of a boundary row
+
+        Returns (rows, more) where more tells whether rows continue past the page in
+        the direction read.
+        """
+        now = datetime.now()
+        self.advance_recurring(now, chat_id)
+        if after is not None:
+            query, params = ACTIVE_JADWAL_AFTER_QUERY, (chat_id, now, after[0], after[0], after[1], limit + 1)
+        elif before is not None:
+            query, params = ACTIVE_JADWAL_BEFORE_QUERY, (chat_id, now, before[0], before[0], before[1], limit + 1)
+        else:
+            query, params = ACTIVE_JADWAL_QUERY, (chat_id, now, limit + 1)
+
+        conn = self._require_connection()
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            cursor.execute(self.sql(query), params)
+            rows = cursor.fetchall()
+            more = len(rows) > limit
+            rows = rows[:limit]
+            # Each row gets its reminder offsets (minutes, largest first) from the primary key
+            by_id = {row['id']: row for row in rows}
+            for row in rows:
+                row['reminders'] = []
+            if rows:
+                cursor.execute(
+                    self.sql(
+                        "SELECT jadwal_id, offset_minutes FROM reminders WHERE jadwal_id IN "
+                        f"({', '.join(['%s'] * len(rows))}) ORDER BY jadwal_id, offset_minutes DESC"
+                    ),
+                    list(by_id)
+                )
+                for reminder in cursor.fetchall():
+                    by_id[reminder['jadwal_id']]['reminders'].append(reminder['offset_minutes'])
+        finally:
+            cursor.close()
+            self.release(conn)
+
+        if before is not None:
+            rows.reverse()
+        return rows, more
+
+    def deactivate_jadwal(self, jadwal_id, chat_id):
+        # Returns the deactivated jadwal, or None if it does not belong to this chat
+        conn = self._require_connection()
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            cursor.execute(
+                self.sql("SELECT nama_event, tanggal_event FROM jadwal WHERE id = %s AND chat_id = %s"),
+                (jadwal_id, chat_id)
+            )
+            jadwal = cursor.fetchone()
+            if not jadwal:
+                return None
+
+            cursor.execute(
+                self.sql("UPDATE jadwal SET is_active = 0 WHERE id = %s AND chat_id = %s"),
+                (jadwal_id, chat_id)
+            )
+            conn.commit()
+            return jadwal
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def advance_recurring(self, now, chat_id=None):
+        """Move recurring jadwal whose occurrence has passed on to their next occurrence
+
+        Series are expanded lazily: the row only ever holds the next occurrence. Its
+        reminders get the fire times of the new occurrence and their claims are cleared,
+        except for fire times already past, which are marked sent as on insert.
+        """
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            query = "SELECT id, tanggal_event, recurrence FROM jadwal WHERE is_active = 1 AND tanggal_event <= %s"
+            if chat_id is None:
+                cursor.execute(self.sql(query + " AND recurrence IS NOT NULL"), (now,))
+            else:
+                cursor.execute(self.sql(query + " AND chat_id = %s AND recurrence IS NOT NULL"), (now, chat_id))
+            passed = cursor.fetchall()
+
+            moved = 0
+            for jadwal_id, when, rule in passed:
+                following = next_occurrence(rule, when, now)
+                # Guarded by the old value so a series advanced concurrently is not moved twice
+                cursor.execute(
+                    self.sql("UPDATE jadwal SET tanggal_event = %s WHERE id = %s AND tanggal_event = %s"),
+                    (following, jadwal_id, when)
+                )
+                if cursor.rowcount != 1:
+                    continue
+                cursor.execute(self.sql("SELECT offset_minutes FROM reminders WHERE jadwal_id = %s"), (jadwal_id,))
+                cursor.executemany(
+                    self.sql("UPDATE reminders SET fire_at = %s, claimed_at = %s, sent_at = %s "
+                             "WHERE jadwal_id = %s AND offset_minutes = %s"),
+                    [(*_reminder_row(jadwal_id, minutes, following, now)[2:], jadwal_id, minutes)
+                     for minutes, in cursor.fetchall()]
+                )
+                moved += 1
+            conn.commit()
+            return moved
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    # Reminders
+    def load_upcoming_reminders(self, start, end):
+        """Reminders firing in [start, end) joined with their jadwal and user name, or None on error"""
+        try:
+            self.advance_recurring(datetime.now())
+        except Exception as e:
+            logger.error(f"Error advancing recurring jadwal: {e}")
+            return None
+
+        conn = self.connect()
+        if conn is None:
+            return None
+
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            cursor.execute(self.sql(UPCOMING_REMINDERS_QUERY), (start, end))
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error loading upcoming reminders: {e}")
+            return None
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def load_missed_reminders(self, since, until, limit):
+        """Up to `limit` unclaimed reminders that should have fired in [since, until), or None on error"""
+        conn = self.connect()
+        if conn is None:
+            return None
+
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            cursor.execute(self.sql(MISSED_REMINDERS_QUERY), (since, until, limit))
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error loading missed reminders: {e}")
+            return None
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    # Outbox
+    def enqueue_reminders(self, reminders, render):
+        """Claim reminder rows and write their message to the outbox in one transaction
+
+        render(claimed) returns the message text for the reminders this caller claimed
+        (rows as loaded by load_upcoming_reminders, all of one chat). Each conditional
+        update is atomic, so only one scheduler can claim a reminder; matching fire_at
+        skips a series that moved on, and the subquery a jadwal deactivated on another
+        replica. Returns the claimed reminders, or None when the database is unavailable.
+        """
+        conn = self.connect()
+        if conn is None:
+            return None
+
+        cursor = self.cursor(conn)
+        try:
+            now = datetime.now()
+            claimed = []
+            for reminder in reminders:
+                cursor.execute(
+                    self.sql(
+                        "UPDATE reminders SET claimed_at = %s "
+                        "WHERE jadwal_id = %s AND offset_minutes = %s AND fire_at = %s AND claimed_at IS NULL "
+                        "AND EXISTS (SELECT 1 FROM jadwal WHERE id = %s AND is_active = 1)"
+                    ),
+                    (now, reminder['id'], reminder['offset_minutes'], reminder['fire_at'], reminder['id'])
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(reminder)
+            if claimed:
+                cursor.execute(
+                    self.sql("INSERT INTO outbox (chat_id, text, reminders, status, attempts, next_retry, created_at) "
+                             "VALUES (%s, %s, %s, 'pending', 0, %s, %s)"),
+                    (
+                        claimed[0]['chat_id'], render(claimed),
+                        json.dumps([[reminder['id'], reminder['offset_minutes']] for reminder in claimed]),
+                        now, now
+                    )
+                )
+            conn.commit()
+            return claimed
+        except Exception as e:
+            logger.error(f"Error enqueueing reminders: {e}")
+            conn.rollback()
+            return None
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def lease_outbox(self, limit, lease):
+        """Lease up to `limit` due outbox messages for `lease` (a timedelta)
+
+        A leased row stays pending with next_retry moved to the lease deadline, so a
+        message whose sender died is picked up again once the lease runs out. Returns
+        dicts with id, chat_id, text, reminders ([jadwal_id, offset_minutes] pairs) and
+        attempts (including this one).
+        """
+        now = datetime.now()
+        conn = self._require_connection()
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            cursor.execute(self.sql(DUE_OUTBOX_QUERY), (now, limit))
+            leased = []
+            for row in cursor.fetchall():
+                # Another worker may lease the same row first; the guard on next_retry decides
+                cursor.execute(
+                    self.sql("UPDATE outbox SET next_retry = %s, attempts = attempts + 1 "
+                             "WHERE id = %s AND status = 'pending' AND next_retry <= %s"),
+                    (now + lease, row['id'], now)
+                )
+                if cursor.rowcount == 1:
+                    row['attempts'] += 1
+                    row['reminders'] = json.loads(row['reminders'])
+                    leased.append(row)
+            conn.commit()
+            return leased
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def finish_outbox(self, results):
+        """Record delivery attempts of leased outbox messages in one transaction
+
+        results: (message, sent, retry_at) tuples. Sent marks the message and its
+        reminders as sent; otherwise the message is retried at retry_at, or marked
+        failed when retry_at is None.
+        """
+        now = datetime.now()
+        sent = [message for message, ok, _ in results if ok]
+        retried = [(retry_at, message['id']) for message, ok, retry_at in results if not ok and retry_at]
+        failed = [(message['id'],) for message, ok, retry_at in results if not ok and not retry_at]
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            if sent:
+                cursor.executemany(
+                    self.sql("UPDATE outbox SET status = 'sent', sent_at = %s WHERE id = %s"),
+                    [(now, message['id']) for message in sent]
+                )
+                cursor.executemany(
+                    self.sql("UPDATE reminders SET sent_at = %s WHERE jadwal_id = %s AND offset_minutes = %s"),
+                    [(now, jadwal_id, minutes) for message in sent for jadwal_id, minutes in message['reminders']]
+                )
+            if retried:
+                cursor.executemany(
+                    self.sql("UPDATE outbox SET next_retry = %s WHERE id = %s AND status = 'pending'"), retried
+                )
+            if failed:
+                cursor.executemany(self.sql("UPDATE outbox SET status = 'failed' WHERE id = %s"), failed)
+            conn.commit()
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def purge_outbox(self, cutoff, limit):
+        # Delete up to `limit` sent or failed outbox messages created before cutoff; returns the count
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            cursor.execute(
+                self.sql("SELECT id FROM outbox WHERE created_at < %s AND status <> 'pending' LIMIT %s"),
+                (cutoff, limit)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if ids:
+                cursor.execute(self.sql(f"DELETE FROM outbox WHERE id IN ({', '.join(['%s'] * len(ids))})"), ids)
+            conn.commit()
+            return len(ids)
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    # Retention
+    def expire_jadwals(self, cutoff, limit, archive=True):
+        """Move (or delete) up to `limit` expired jadwal in one short transaction; returns the count
+
+        Expired means the event is older than cutoff, or it was stopped and created
+        before cutoff. Their reminders rows go with them.
+        """
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            cursor.execute(
+                self.sql("SELECT id FROM jadwal WHERE is_active = 1 AND tanggal_event < %s AND recurrence IS NULL LIMIT %s"),
+                (cutoff, limit)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if len(ids) < limit:
+                cursor.execute(
+                    self.sql("SELECT id FROM jadwal WHERE is_active = 0 AND created_at < %s LIMIT %s"),
+                    (cutoff, limit - len(ids))
+                )
+                ids += [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return 0
+
+            in_ids = ', '.join(['%s'] * len(ids))
+            if archive:
+                cursor.execute(
+                    self.sql(
+                        "INSERT INTO jadwal_archive (id, nama_event, tanggal_event, chat_id, ingatkan_h12, "
+                        "ingatkan_h4, ingatkan_h1, is_active, recurrence, created_at, archived_at) "
+                        "SELECT id, nama_event, tanggal_event, chat_id, ingatkan_h12, ingatkan_h4, ingatkan_h1, "
+                        f"is_active, recurrence, created_at, %s FROM jadwal WHERE id IN ({in_ids})"
+                    ),
+                    [datetime.now()] + ids
+                )
+            cursor.execute(self.sql(f"DELETE FROM reminders WHERE jadwal_id IN ({in_ids})"), ids)
+            cursor.execute(self.sql(f"DELETE FROM jadwal WHERE id IN ({in_ids})"), ids)
+            conn.commit()
+            return len(ids)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    # Conversation persistence
+    def load_conversations(self, handler, cutoff):
+        # Conversations idle since before cutoff are evicted instead of resumed
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            cursor.execute(
+                self.sql("DELETE FROM conversation_state WHERE handler = %s AND updated_at < %s"),
+                (handler, cutoff)
+            )
+            cursor.execute(
+                self.sql("SELECT conv_key, state FROM conversation_state WHERE handler = %s"),
+                (handler,)
+            )
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def load_user_states(self, cutoff):
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            cursor.execute(self.sql("DELETE FROM user_state WHERE updated_at < %s"), (cutoff,))
+            cursor.execute("SELECT user_id, data FROM user_state")
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            cursor.close()
+            self.release(conn)
+
+    def save_states(self, conversations, users):
+        """Write a batch of conversation states and user_data in one transaction
+
+        conversations: (handler, conv_key, state) tuples; users: (user_id, data) tuples.
+        A state or data of None deletes the row.
+        """
+        now = datetime.now()
+        conn = self._require_connection()
+        cursor = self.cursor(conn)
+        try:
+            saved = [(h, k, s, now) for h, k, s in conversations if s is not None]
+            dropped = [(h, k) for h, k, s in conversations if s is None]
+            if saved:
+                cursor.executemany(
+                    self.sql("REPLACE INTO conversation_state (handler, conv_key, state, updated_at) "
+                             "VALUES (%s, %s, %s, %s)"),
+                    saved
+                )
+            if dropped:
+                cursor.executemany(
+                    self.sql("DELETE FROM conversation_state WHERE handler = %s AND conv_key = %s"), dropped
+                )
+
+            saved = [(u, d, now) for u, d in users if d is not None]
+            dropped = [(u,) for u, d in users if d is None]
+            if saved:
+                cursor.executemany(
+                    self.sql("REPLACE INTO user_state (user_id, data, updated_at) VALUES (%s, %s, %s)"), saved
+                )
+            if dropped:
+                cursor.executemany(self.sql("DELETE FROM user_state WHERE user_id = %s"), dropped)
+            conn.commit()
+        finally:
+            cursor.close()
+            self.release(conn)
+
+
+class MySQLRepository(Repository):
+    """MySQL backend using the shared connection pool from db.py"""
+
+    backend = 'mysql'
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            chat_id BIGINT UNIQUE NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS jadwal (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nama_event VARCHAR(255) NOT NULL,
+            tanggal_event DATETIME NOT NULL,
+            chat_id BIGINT NOT NULL,
+            ingatkan_h12 TINYINT(1) DEFAULT 0,
+            ingatkan_h4 TINYINT(1) DEFAULT 0,
+            ingatkan_h1 TINYINT(1) DEFAULT 0,
+            is_active TINYINT(1) DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Columns added after the first release (for existing databases)
+        "ALTER TABLE jadwal ADD COLUMN IF NOT EXISTS ingatkan_h1 TINYINT(1) DEFAULT 0",
+        "ALTER TABLE jadwal ADD COLUMN IF NOT EXISTS is_active TINYINT(1) DEFAULT 1",
+    )
+    UPSERT_USER = (
+        "INSERT INTO users (chat_id, name) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE name = VALUES(name)"
+    )
+
+    def connect(self):
+        return get_db_connection()
+
+    def leader_lock(self):
+        return LeaderLock()
+
+    def _lock_migrations(self, cursor):
+        cursor.execute("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Timed out waiting for the migration lock")
+
+    def _unlock_migrations(self, cursor):
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        cursor.fetchone()
+
+    def _is_duplicate_index(self, err):
+        return isinstance(err, mysql.connector.Error) and err.errno == errorcode.ER_DUP_KEYNAME
+
+    def _insert_jadwal_rows(self, cursor, rows):
+        # One multi-row INSERT tagged with a token of its own (migration 7), read back by that
+        # token; AUTO_INCREMENT ids of a statement's rows increase in row order
+        token = uuid.uuid4().hex
+        cursor.executemany(
+            "INSERT INTO jadwal (nama_event, tanggal_event, chat_id, recurrence, batch_token) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [(*row, token) for row in rows]
+        )
+        cursor.execute("SELECT id FROM jadwal WHERE batch_token = %s ORDER BY id", (token,))
+        ids = [row[0] for row in cursor.fetchall()]
+        if len(ids) != len(rows):
+            raise RuntimeError(f"Inserted {len(rows)} jadwal but read back {len(ids)}")
+        return ids
+
+    def explain_full_scans(self, queries):
+        conn = self._require_connection()
+        cursor = self.cursor(conn, dictionary=True)
+        try:
+            full_scans = []
+            for name, sql, params in queries:
+                cursor.execute("EXPLAIN " + sql, params)
+                for row in cursor.fetchall():
+                    if row['type'] == 'ALL':
+                        logger.error(f"{name}: full scan of {row['table']}")
+                        full_scans.append(name)
+            return full_scans
+        finally:
+            cursor.close()
+            self.release(conn)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class _DictCursor(sqlite3.Cursor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.row_factory = _dict_row
+
+
+# DATETIME/TIMESTAMP columns round-trip as naive datetimes, stored as sortable ISO text
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SQLiteRepository(Repository):
+    """Embedded single-node backend: one WAL-mode connection per thread, no network round trips"""
+
+    backend = 'sqlite'
+    placeholder = '?'
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS jadwal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nama_event TEXT NOT NULL,
+            tanggal_event DATETIME NOT NULL,
+            chat_id INTEGER NOT NULL,
+            ingatkan_h12 INTEGER DEFAULT 0,
+            ingatkan_h4 INTEGER DEFAULT 0,
+            ingatkan_h1 INTEGER DEFAULT 0,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    )
+    UPSERT_USER = (
+        "INSERT INTO users (chat_id, name) VALUES (%s, %s) "
+        "ON CONFLICT(chat_id) DO UPDATE SET name = excluded.name"
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, detect_types=sqlite3.PARSE_DECLTYPES)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def release(self, conn):
+        # Connections are per thread and reused; roll back anything left open by an error
+        if conn.in_transaction:
+            conn.rollback()
+
+    def cursor(self, conn, dictionary=False):
+        return conn.cursor(_DictCursor) if dictionary else conn.cursor()
+
+    def _is_duplicate_index(self, err):
+        return isinstance(err, sqlite3.OperationalError) and 'already exists' in str(err)
+
+    def explain_full_scans(self, queries):
+        conn = self.connect()
+        cursor = self.cursor(conn)
+        try:
+            full_scans = []
+            for name, sql, params in queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + self.sql(sql), params)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if detail.startswith('SCAN') and 'INDEX' not in detail:
+                        logger.error(f"{name}: {detail}")
+                        full_scans.append(name)
+            return full_scans
+        finally:
+            cursor.close()
+            self.release(conn)
+
+
+def create_repository():
+    """Backend selected by DB_BACKEND: 'mysql' (default) or 'sqlite' with DB_PATH"""
+    backend = os.getenv('DB_BACKEND', 'mysql').lower()
+    if backend == 'sqlite':
+        return SQLiteRepository(os.getenv('DB_PATH', 'pengingat.db'))
+    if backend != 'mysql':
+        raise ValueError(f"Unknown DB_BACKEND: {backend}")
+    return MySQLRepository()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to bot.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A migrated SQLiteRepository on a temporary file"""
+    repo = storage.SQLiteRepository(str(tmp_path / 'pengingat.db'))
+    assert repo.init_schema()
+    return repo
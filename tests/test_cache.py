@@ -0,0 +1,94 @@
+import random
+from datetime import datetime, timedelta
+
+from cache import TTLCache, UpcomingCache
+
+NOW = datetime(2030, 1, 1, 8, 0)
+
+
+def event(jadwal_id, minutes, rule=None):
+    return {'id': jadwal_id, 'tanggal_event': NOW + timedelta(minutes=minutes), 'recurrence': rule}
+
+
+def reference_page(events, limit, after=None, before=None):
+    # What Repository.get_active_jadwals_page returns for the same rows
+    keys = sorted(events, key=lambda e: (e['tanggal_event'], e['id']))
+    if before is not None:
+        rows = [e for e in keys if (e['tanggal_event'], e['id']) < before]
+        return rows[-limit:], len(rows) > limit
+    rows = [e for e in keys if after is None or (e['tanggal_event'], e['id']) > after]
+    return rows[:limit], len(rows) > limit
+
+
+def test_ttl_cache_lru_and_expiry(monkeypatch):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts b, the least recently used
+    assert cache.get('b') is None and cache.get('a') == 1
+    clock = __import__('time').monotonic() + 11
+    monkeypatch.setattr('cache.time.monotonic', lambda: clock)
+    assert cache.get('a') is None
+
+
+def test_pages_match_the_database_order():
+    rng = random.Random(7)
+    events = [event(i, rng.randint(1, 30)) for i in range(40)]
+    for complete, max_events in ((True, 100), (False, 15)):
+        cache = UpcomingCache(max_events=max_events)
+        rows = sorted(events, key=lambda e: (e['tanggal_event'], e['id']))[:max_events]
+        cache.set(1, rows, complete, cache.token())
+        keys = [(e['tanggal_event'], e['id']) for e in events]
+        for anchor in [None] + keys:
+            for direction in ('after', 'before'):
+                kwargs = {direction: anchor} if anchor else {}
+                page = cache.page(1, NOW, 10, **kwargs)
+                if page is not None:
+                    assert page == reference_page(events, 10, **kwargs)
+                elif complete:
+                    raise AssertionError(f"complete entry did not cover {kwargs}")
+
+
+def test_add_remove_and_passed_events():
+    cache = UpcomingCache()
+    assert cache.page(1, NOW, 10) is None
+    cache.set(1, [event(1, 10), event(2, 20)], True, cache.token())
+    cache.add(1, event(3, 5))
+    cache.remove(1, 2)
+    assert [e['id'] for e in cache.page(1, NOW, 10)[0]] == [3, 1]
+    # Events leave the entry once their time has passed
+    assert [e['id'] for e in cache.page(1, NOW + timedelta(minutes=7), 10)[0]] == [1]
+
+
+def test_passed_recurring_event_drops_the_entry():
+    cache = UpcomingCache()
+    cache.set(1, [event(1, 10, rule='daily'), event(2, 20)], True, cache.token())
+    assert cache.page(1, NOW + timedelta(minutes=15), 10) is None
+    assert not cache.cached(1, NOW)
+
+
+def test_load_overlapping_a_write_is_not_stored():
+    cache = UpcomingCache()
+    token = cache.token()
+    cache.remove(1, 5)  # a stop while the load was running
+    cache.set(1, [event(5, 10)], True, token)
+    assert cache.page(1, NOW, 10) is None
+
+
+def test_incomplete_entry_keeps_its_prefix():
+    cache = UpcomingCache(max_events=2)
+    cache.set(1, [event(1, 10), event(2, 20)], False, cache.token())
+    cache.add(1, event(3, 30))  # beyond the cached part
+    cache.add(1, event(4, 5))  # inside: the last cached event is pushed out
+    assert cache.page(1, NOW, 1) == ([event(4, 5)], True)
+    # Whether anything follows the cached events is unknown
+    assert cache.page(1, NOW, 2) is None
+
+
+def test_lru_bound():
+    cache = UpcomingCache(maxsize=2)
+    for chat in (1, 2, 3):
+        cache.set(chat, [event(chat, 10)], True, cache.token())
+    assert len(cache) == 2
+    assert cache.page(1, NOW, 10) is None
@@ -0,0 +1,33 @@
+from db import CircuitBreaker
+
+
+def test_breaker_opens_probes_and_closes(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('db.time.monotonic', lambda: clock[0])
+    breaker = CircuitBreaker(failures=2, cooldown=5)
+
+    breaker.record(False)
+    assert breaker.allow() and breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock[0] += 5
+    assert breaker.allow()  # the probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # everyone else keeps failing fast
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock[0] += 5
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failures=2, cooldown=5)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,78 @@
+import io
+from datetime import datetime
+
+import importer
+
+NOW = datetime(2030, 1, 1, 8, 0)
+
+
+def parse_csv(text):
+    return list(importer.parse_csv(io.StringIO(text), NOW))
+
+
+def parse_ics(text):
+    return list(importer.parse_ics(io.StringIO(text), NOW))
+
+
+def test_csv_rows_header_and_errors():
+    rows = parse_csv(
+        "nama_event,tanggal,waktu,pengingat,ulang\n"
+        "Rapat,02-01-2030,14:30,h12 h1,\n"
+        "Senam,01-01-2030,07:00,30 menit,harian\n"
+        "Lalu,01-01-2029,10:00,,\n"
+        "Salah,2030-01-02,10:00\n"
+    )
+    assert rows[0] == (2, ('Rapat', datetime(2030, 1, 2, 14, 30), [720, 60], None), None)
+    # A series that started earlier is moved on to its next occurrence
+    assert rows[1] == (3, ('Senam', datetime(2030, 1, 2, 7, 0), [30], 'daily'), None)
+    assert rows[2][1] is None and 'masa depan' in rows[2][2]
+    assert rows[3][1] is None and 'tanggal' in rows[3][2]
+
+
+def test_csv_semicolon_and_default_reminders():
+    (line, row, error), = parse_csv("Presentasi;03-01-2030;09:00\n")
+    assert error is None
+    assert row[2] == [720, 240, 60]
+
+
+def test_csv_rejects_reminders_beyond_the_series_period():
+    (_, row, error), = parse_csv("Rapat,02-01-2030,14:30,1 hari,harian\n")
+    assert row is None and 'berulang' in error
+
+
+def test_ics_alarms_and_rules():
+    (line, row, error), = parse_ics(
+        "BEGIN:VCALENDAR\n"
+        "BEGIN:VEVENT\n"
+        "SUMMARY:Rapat\\, mingguan\n"
+        "DTSTART:20300107T100000\n"
+        "RRULE:FREQ=WEEKLY;BYDAY=MO\n"
+        "BEGIN:VALARM\nTRIGGER:-PT30M\nEND:VALARM\n"
+        "BEGIN:VALARM\nTRIGGER;RELATED=END:-PT5M\nEND:VALARM\n"
+        "BEGIN:VALARM\nTRIGGER:-P1D\nEND:VALARM\n"
+        "END:VEVENT\n"
+        "END:VCALENDAR\n"
+    )
+    assert error is None
+    assert row == ('Rapat, mingguan', datetime(2030, 1, 7, 10, 0), [1440, 30], 'weekly')
+
+
+def test_ics_rejects_all_day_and_unsupported_rules():
+    rows = parse_ics(
+        "BEGIN:VEVENT\nSUMMARY:Libur\nDTSTART;VALUE=DATE:20300105\nEND:VEVENT\n"
+        "BEGIN:VEVENT\nSUMMARY:Rapat\nDTSTART:20300105T100000\nRRULE:FREQ=DAILY;COUNT=3\nEND:VEVENT\n"
+    )
+    assert [row for _, row, _ in rows] == [None, None]
+
+
+def test_import_events_inserts_in_chunks(repo):
+    data = "".join(f"Event {i},02-01-2031,10:{i:02d},h1\n" for i in range(25)).encode()
+    progress = []
+    imported, failed, errors = importer.import_events(
+        repo, 42, data, 'csv', progress=lambda *counts: progress.append(counts), chunk=10
+    )
+    assert (imported, failed, errors) == (25, 0, [])
+    assert progress == [(10, 0), (20, 0)]
+    rows, more = repo.get_active_jadwals_page(42, 100)
+    assert len(rows) == 25 and not more
+    assert all(row['reminders'] == [60] for row in rows)
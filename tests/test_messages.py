@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import bot
+
+
+def reminder(i, minutes=60, name=None):
+    event = datetime(2030, 1, 1, 12, 0) + timedelta(minutes=i)
+    return {
+        'id': i, 'nama_event': name or f"Event {i}", 'tanggal_event': event, 'offset_minutes': minutes,
+        'fire_at': event - timedelta(minutes=minutes), 'chat_id': 1, 'name': "Ani",
+    }
+
+
+def test_message_length_counts_utf16_units():
+    assert bot.message_length("abc") == 3
+    assert bot.message_length("🔔") == 2
+
+
+def test_fit_lines_keeps_everything_that_fits():
+    assert bot.fit_lines("H\n", ["a\n", "b\n"], "F") == "H\na\nb\nF"
+
+
+def test_fit_lines_cuts_at_the_limit():
+    lines = [f"baris {i:02d}\n" for i in range(10)]
+    text = bot.fit_lines("H\n", lines, "F", limit=60)
+    assert bot.message_length(text) <= 60
+    assert text.startswith("H\nbaris 00\n") and text.endswith("lainnya\nF")
+    shown = text.count("baris ")
+    assert f"… dan {10 - shown} lainnya\n" in text
+
+
+def test_render_digest_sorts_by_event():
+    text = bot.render_digest([reminder(30, 720), reminder(10, 240)])
+    assert text.startswith("🔔 **2 pengingat jadwal Anda:**")
+    assert text.index("Event 10") < text.index("Event 30")
+    assert "(4 jam lagi)" in text and "(12 jam lagi)" in text
+
+
+def test_large_digest_stays_within_telegrams_limit():
+    reminders = [reminder(i, name="🎉" * 40) for i in range(500)]
+    text = bot.render_reminders(reminders)
+    assert text.startswith("Halo Ani! 🔔 **500 pengingat jadwal Anda:**")
+    assert bot.message_length(text) <= bot.MAX_MESSAGE_LENGTH
+    assert "lainnya" in text
+    assert text.endswith("Jangan lupa persiapkan diri Anda! 🚀")
+
+
+def test_single_reminder_uses_its_own_message():
+    text = bot.render_reminders([reminder(1)])
+    assert text.startswith("Halo Ani! 🚨 **Peringatan H-1 jam!**")
+
+
+def test_missed_reminders_are_summarised_per_event():
+    now = datetime.now()
+    passed = dict(reminder(1, 720, "Rapat"), tanggal_event=now - timedelta(hours=1),
+                  fire_at=now - timedelta(hours=13))
+    earlier = dict(passed, offset_minutes=240, fire_at=now - timedelta(hours=5))
+    coming = dict(reminder(2, 60, "Ujian"), tanggal_event=now + timedelta(minutes=30, seconds=30),
+                  fire_at=now - timedelta(minutes=30))
+    text = bot.render_missed([passed, earlier, coming])
+    assert text.startswith("Halo Ani! ⚠️ **Pengingat terlewat**")
+    assert text.count("Rapat") == 1
+    assert "(sudah lewat)" in text and "(30 menit lagi)" in text
+    assert text.index("Rapat") < text.index("Ujian")
+
+
+def test_slightly_late_reminders_go_out_as_usual():
+    now = datetime.now()
+    late = dict(reminder(1), tanggal_event=now + timedelta(minutes=58), fire_at=now - timedelta(minutes=2))
+    assert bot.render_missed([late]) == bot.render_reminders([late])
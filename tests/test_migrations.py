@@ -0,0 +1,15 @@
+from datetime import datetime
+
+from migrations import MIGRATIONS, hot_queries
+
+
+def test_fresh_database_reaches_latest_version(repo):
+    conn = repo.connect()
+    try:
+        assert repo.apply_migrations(conn) == MIGRATIONS[-1][0]
+    finally:
+        repo.release(conn)
+
+
+def test_hot_queries_use_indexes(repo):
+    assert repo.explain_full_scans(hot_queries(datetime.now())) == []
@@ -0,0 +1,36 @@
+import pytest
+
+import offsets
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1 hari, 30 menit', [1440, 30]),
+    ('2j 15m', [120, 15]),
+    ('', []),
+    ('h12 h1', [720, 60]),
+    ('H-4 & 1 hari', [1440, 240]),
+    ('all', [720, 240, 60]),
+    ('30m, 30 menit', [30]),
+])
+def test_parse_offsets(text, expected):
+    assert offsets.parse_offsets(text) == expected
+
+
+@pytest.mark.parametrize('text', ['besok', '5 tahun', '0m', '31 hari', '2 hr', '1m 2m 3m 4m 5m 6m'])
+def test_parse_offsets_rejects(text):
+    with pytest.raises(ValueError):
+        offsets.parse_offsets(text)
+
+
+def test_parse_offsets_limits_recurring_series_to_their_period():
+    assert offsets.parse_offsets('23 jam', period=1440) == [1380]
+    with pytest.raises(ValueError):
+        offsets.parse_offsets('1 hari', period=1440)
+
+
+def test_format_and_label():
+    assert offsets.format_offset(1470) == '1 hari 30 menit'
+    assert offsets.offset_label(720) == 'H-12 jam'
+    assert offsets.offset_label(90) == '1 jam 30 menit sebelumnya'
+    assert offsets.offset_kind(60) == 'h1'
+    assert offsets.offset_kind(90) == 'custom'
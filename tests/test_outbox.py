@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import outbox
+from outbox import OutboxRelay
+
+
+class FakeQueue:
+    def __init__(self, results):
+        self.results = list(results)
+        self.texts = []
+
+    async def put(self, chat_id, text, on_done=None, **kwargs):
+        self.texts.append(text)
+        await on_done(self.results.pop(0) if self.results else True)
+
+
+def render(reminders):
+    return ', '.join(reminder['nama_event'] for reminder in reminders)
+
+
+def enqueue(repo, *names):
+    now = datetime.now()
+    for name in names:
+        repo.insert_jadwal(name, now + timedelta(minutes=90), 1, [60])
+    for reminder in repo.load_upcoming_reminders(now, now + timedelta(hours=2)):
+        repo.enqueue_reminders([reminder], render)
+
+
+def reminder_rows(repo):
+    conn = repo.connect()
+    try:
+        return conn.execute(
+            "SELECT jadwal_id, offset_minutes, claimed_at IS NOT NULL, sent_at IS NOT NULL "
+            "FROM reminders ORDER BY jadwal_id, offset_minutes DESC"
+        ).fetchall()
+    finally:
+        repo.release(conn)
+
+
+def outbox_rows(repo):
+    conn = repo.connect()
+    try:
+        return conn.execute("SELECT id, status, attempts FROM outbox ORDER BY id").fetchall()
+    finally:
+        repo.release(conn)
+
+
+async def run_relay(relay, seconds):
+    task = asyncio.create_task(relay.run())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_relay_sends_retries_and_gives_up(repo, monkeypatch):
+    monkeypatch.setattr(outbox, 'RETRY_BASE_SECONDS', 0)
+    enqueue(repo, "A", "B")
+    finished = []
+    # A is sent at once; B fails twice and is given up after max_attempts
+    relay = OutboxRelay(
+        repo, FakeQueue([True, False, False]), poll_interval=0.05, max_attempts=2,
+        on_finish=lambda message, status: finished.append((message['text'], status))
+    )
+    asyncio.run(run_relay(relay, 0.5))
+    assert outbox_rows(repo) == [(1, 'sent', 1), (2, 'failed', 2)]
+    assert finished == [("A", 'sent'), ("B", 'retried'), ("B", 'failed')]
+
+
+def test_claim_is_taken_once_and_skips_stopped_jadwal(repo):
+    now = datetime.now()
+    first = repo.insert_jadwal("A", now + timedelta(minutes=90), 1, [60])
+    second = repo.insert_jadwal("B", now + timedelta(minutes=90), 1, [60])
+    reminders = repo.load_upcoming_reminders(now, now + timedelta(hours=2))
+    repo.deactivate_jadwal(second, 1)
+
+    claimed = repo.enqueue_reminders(reminders, render)
+    assert [r['id'] for r in claimed] == [first]
+    assert repo.enqueue_reminders(reminders, render) == []
+    assert outbox_rows(repo) == [(1, 'pending', 0)]
+
+
+def test_outbox_transitions(repo):
+    now = datetime.now()
+    for name in ("A", "B", "C"):
+        repo.insert_jadwal(name, now + timedelta(minutes=90), 1, [60])
+    for reminder in repo.load_upcoming_reminders(now, now + timedelta(hours=2)):
+        repo.enqueue_reminders([reminder], render)
+
+    leased = repo.lease_outbox(10, timedelta(minutes=1))
+    assert [(m['text'], m['attempts']) for m in leased] == [("A", 1), ("B", 1), ("C", 1)]
+    # Leased rows are not handed out again until the lease runs out
+    assert repo.lease_outbox(10, timedelta(minutes=1)) == []
+
+    sent, retried, failed = leased
+    repo.finish_outbox([(sent, True, None), (retried, False, now - timedelta(seconds=1)), (failed, False, None)])
+    assert outbox_rows(repo) == [(1, 'sent', 1), (2, 'pending', 1), (3, 'failed', 1)]
+    assert [row[3] for row in reminder_rows(repo)] == [1, 0, 0]
+
+    again = repo.lease_outbox(10, timedelta(minutes=1))
+    assert [(m['id'], m['attempts']) for m in again] == [(2, 2)]
+
+    assert repo.purge_outbox(now + timedelta(days=1), 10) == 2
+    assert outbox_rows(repo) == [(2, 'pending', 2)]
+
+
+def test_expired_lease_is_picked_up_again(repo):
+    now = datetime.now()
+    repo.insert_jadwal("A", now + timedelta(minutes=90), 1, [60])
+    repo.enqueue_reminders(repo.load_upcoming_reminders(now, now + timedelta(hours=2)), render)
+    assert len(repo.lease_outbox(10, timedelta(seconds=-1))) == 1
+    assert [m['attempts'] for m in repo.lease_outbox(10, timedelta(minutes=1))] == [2]
+
+
+def test_enqueue_without_database_returns_none(repo, monkeypatch):
+    now = datetime.now()
+    repo.insert_jadwal("A", now + timedelta(minutes=90), 1, [60])
+    reminders = repo.load_upcoming_reminders(now, now + timedelta(hours=2))
+    monkeypatch.setattr(repo, 'connect', lambda: None)
+    assert repo.enqueue_reminders(reminders, render) is None
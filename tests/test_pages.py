@@ -0,0 +1,134 @@
+import asyncio
+import re
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None):
+        self.replies.append((text, reply_markup))
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.edits = []
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.edits.append((text, reply_markup))
+
+
+def command(handler, chat_id):
+    message = FakeMessage()
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=message)
+    asyncio.run(handler(update, None))
+    return message.replies[-1]
+
+
+def click(handler, chat_id, data):
+    query = FakeQuery(data)
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), callback_query=query)
+    asyncio.run(handler(update, None))
+    return query.edits[-1]
+
+
+def numbers(text):
+    return [int(n) for n in re.findall(r'^(\d+)\. ', text, re.MULTILINE)]
+
+
+def buttons(reply_markup):
+    return {button.text: button.callback_data for row in reply_markup.inline_keyboard for button in row}
+
+
+@pytest.fixture
+def bot_repo(repo, monkeypatch):
+    monkeypatch.setattr(bot, 'repo', repo)
+    for cache in (bot.upcoming_cache, bot.stale_list_cache, bot.user_name_cache):
+        cache.clear()
+    repo.save_user_name(1, "Ani")
+    repo.save_user_name(2, "Budi")
+    now = datetime.now()
+    ids = repo.insert_jadwals([(f"E{i:02d}", now + timedelta(hours=i + 1), 1, [60]) for i in range(25)])
+    repo.insert_jadwal("Milik Budi", now + timedelta(hours=1), 2, [60])
+    yield ids
+    for cache in (bot.upcoming_cache, bot.stale_list_cache, bot.user_name_cache):
+        cache.clear()
+
+
+def test_list_pages_forward_and_back(bot_repo):
+    text, markup = command(bot.list_jadwal, 1)
+    assert numbers(text) == list(range(1, 11))
+    assert "Milik Budi" not in text
+    assert list(buttons(markup)) == ["Berikutnya ➡️"]
+
+    text, markup = click(bot.handle_page_callback, 1, buttons(markup)["Berikutnya ➡️"])
+    assert numbers(text) == list(range(11, 21))
+    assert "**E10**" in text
+    assert list(buttons(markup)) == ["⬅️ Sebelumnya", "Berikutnya ➡️"]
+
+    text, markup = click(bot.handle_page_callback, 1, buttons(markup)["Berikutnya ➡️"])
+    assert numbers(text) == list(range(21, 26))
+    assert list(buttons(markup)) == ["⬅️ Sebelumnya"]
+
+    text, markup = click(bot.handle_page_callback, 1, buttons(markup)["⬅️ Sebelumnya"])
+    assert numbers(text) == list(range(11, 21))
+
+
+def test_stop_pages_and_stop_callback(bot_repo):
+    _, markup = command(bot.stop_reminder, 1)
+    choices = buttons(markup)
+    assert len([data for data in choices.values() if data.startswith('stop_')]) == 10
+    assert choices["❌ Batal"] == 'cancel_stop'
+
+    _, markup = click(bot.handle_page_callback, 1, choices["Berikutnya ➡️"])
+    second = buttons(markup)
+    assert f"stop_{bot_repo[10]}" in second.values()
+
+    text, _ = click(bot.handle_stop_callback, 1, f"stop_{bot_repo[10]}")
+    assert "Pengingat dihentikan" in text and "E10" in text
+    _, markup = click(bot.handle_page_callback, 1, choices["Berikutnya ➡️"])
+    assert f"stop_{bot_repo[10]}" not in buttons(markup).values()
+
+    # Another chat cannot stop it
+    text, _ = click(bot.handle_stop_callback, 2, f"stop_{bot_repo[0]}")
+    assert text == "❌ Jadwal tidak ditemukan."
+    assert click(bot.handle_stop_callback, 1, 'cancel_stop')[0] == "❌ Operasi dibatalkan."
+
+
+def test_list_falls_back_to_the_last_page_while_the_database_is_down(bot_repo, monkeypatch):
+    text, _ = command(bot.list_jadwal, 1)
+
+    def unavailable(*args, **kwargs):
+        raise bot.DatabaseUnavailable("circuit open")
+
+    monkeypatch.setattr(bot.repo, 'get_active_jadwals_page', unavailable)
+    bot.upcoming_cache.clear()
+    stale, _ = command(bot.list_jadwal, 1)
+    assert stale == text + bot.STALE_LIST_NOTE
+    # /stop changes data, so it does not serve an old page
+    assert command(bot.stop_reminder, 1)[0] == "❌ Gagal terhubung ke database. Silakan coba lagi nanti."
+
+
+def test_pages_come_from_the_upcoming_cache(bot_repo, monkeypatch):
+    _, markup = command(bot.list_jadwal, 1)
+
+    def no_queries(*args, **kwargs):
+        raise AssertionError("page read from the database")
+
+    monkeypatch.setattr(bot.repo, 'get_active_jadwals_page', no_queries)
+    text, _ = click(bot.handle_page_callback, 1, buttons(markup)["Berikutnya ➡️"])
+    assert numbers(text) == list(range(11, 21))
+    # A stopped jadwal leaves the cached pages at once
+    click(bot.handle_stop_callback, 1, f"stop_{bot_repo[0]}")
+    text, _ = command(bot.list_jadwal, 1)
+    assert "**E00**" not in text and numbers(text) == list(range(1, 11))
@@ -0,0 +1,57 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from persistence import RepositoryPersistence
+
+
+def age_rows(repo, table, key, value, days):
+    conn = repo.connect()
+    try:
+        conn.execute(f"UPDATE {table} SET updated_at = ? WHERE {key} = ?",
+                     (datetime.now() - timedelta(days=days), value))
+        conn.commit()
+    finally:
+        repo.release(conn)
+
+
+def test_state_survives_a_restart(repo):
+    event = datetime(2030, 5, 1, 14, 30)
+
+    async def before():
+        persistence = RepositoryPersistence(repo)
+        await persistence.update_conversation('tambah_jadwal', (1, 1), 3)
+        await persistence.update_conversation('tambah_jadwal', (2, 2), 2)
+        await persistence.update_user_data(1, {'event_name': "Rapat", 'event_datetime': event})
+        await persistence.flush()
+
+    async def after():
+        persistence = RepositoryPersistence(repo)
+        return (await persistence.get_conversations('tambah_jadwal'), await persistence.get_user_data())
+
+    asyncio.run(before())
+    conversations, user_data = asyncio.run(after())
+    assert conversations == {(1, 1): 3, (2, 2): 2}
+    assert user_data[1] == {'event_name': "Rapat", 'event_datetime': event}
+
+
+def test_finished_and_idle_conversations_are_dropped(repo):
+    async def before():
+        persistence = RepositoryPersistence(repo)
+        for chat_id in (1, 2, 3):
+            await persistence.update_conversation('tambah_jadwal', (chat_id, chat_id), 1)
+            await persistence.update_user_data(chat_id, {'event_name': f"E{chat_id}"})
+        # Chat 1 finished its conversation
+        await persistence.update_conversation('tambah_jadwal', (1, 1), None)
+        await persistence.update_user_data(1, {})
+
+    async def after():
+        persistence = RepositoryPersistence(repo, timeout=timedelta(hours=1))
+        return (await persistence.get_conversations('tambah_jadwal'), await persistence.get_user_data())
+
+    asyncio.run(before())
+    # Chat 2 has been idle past the timeout
+    age_rows(repo, 'conversation_state', 'conv_key', '[2, 2]', 1)
+    age_rows(repo, 'user_state', 'user_id', 2, 1)
+    conversations, user_data = asyncio.run(after())
+    assert conversations == {(3, 3): 1}
+    assert user_data == {3: {'event_name': "E3"}}
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+import recurrence
+
+
+def test_next_occurrence_of_a_future_start_is_the_start():
+    start = datetime(2030, 1, 1, 9, 0)
+    assert recurrence.next_occurrence('daily', start, datetime(2029, 12, 1)) == start
+
+
+def test_next_occurrence_daily_and_weekly():
+    start = datetime(2030, 1, 1, 9, 0)
+    assert recurrence.next_occurrence('daily', start, datetime(2030, 1, 3, 9, 0)) == datetime(2030, 1, 4, 9, 0)
+    assert recurrence.next_occurrence('weekly', start, datetime(2030, 1, 2)) == datetime(2030, 1, 8, 9, 0)
+
+
+def test_monthly_keeps_the_day_of_month_through_short_months():
+    start = datetime(2030, 1, 31, 9, 0)
+    rule = recurrence.make_rule('monthly', start)
+    assert rule == 'monthly:31'
+    assert recurrence.occurrences(rule, start, 4) == [
+        datetime(2030, 1, 31, 9, 0), datetime(2030, 2, 28, 9, 0),
+        datetime(2030, 3, 31, 9, 0), datetime(2030, 4, 30, 9, 0),
+    ]
+
+
+def test_shortest_period():
+    assert recurrence.shortest_period('daily') == timedelta(days=1)
+    assert recurrence.shortest_period('weekly') == timedelta(weeks=1)
+    assert recurrence.shortest_period('monthly:31') == timedelta(days=28)
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from retention import RetentionJob
+
+
+def names(repo, table):
+    conn = repo.connect()
+    try:
+        return [row[0] for row in conn.execute(f"SELECT nama_event FROM {table} ORDER BY id").fetchall()]
+    finally:
+        repo.release(conn)
+
+
+def test_expire_jadwals_archives_past_events(repo):
+    now = datetime.now()
+    repo.insert_jadwal("Old", now - timedelta(days=40), 1, [60])
+    repo.insert_jadwal("New", now + timedelta(days=1), 1, [60])
+    assert repo.expire_jadwals(now - timedelta(days=30), 10) == 1
+    assert names(repo, 'jadwal_archive') == ["Old"]
+    assert names(repo, 'jadwal') == ["New"]
+
+
+def test_run_once_expires_in_batches_and_purges_the_outbox(repo):
+    now = datetime.now()
+    for name in ("Old1", "Old2", "Old3"):
+        repo.insert_jadwal(name, now - timedelta(days=40), 1, [60])
+    stopped = repo.insert_jadwal("Stopped", now + timedelta(days=1), 1, [60])
+    repo.insert_jadwal("New", now + timedelta(days=1), 1, [60])
+    repo.deactivate_jadwal(stopped, 1)
+    repo.enqueue_reminders(repo.load_upcoming_reminders(now, now + timedelta(days=2)),
+                           lambda claimed: claimed[0]['nama_event'])
+    repo.finish_outbox([(message, True, None) for message in repo.lease_outbox(10, timedelta(minutes=1))])
+    conn = repo.connect()
+    try:
+        conn.execute("UPDATE jadwal SET created_at = ?", (now - timedelta(days=40),))
+        conn.execute("UPDATE outbox SET created_at = ?", (now - timedelta(days=40),))
+        conn.commit()
+    finally:
+        repo.release(conn)
+
+    job = RetentionJob(repo, days=30, batch_size=2, pause=0)
+    assert asyncio.run(job.run_once()) == 4
+    assert names(repo, 'jadwal_archive') == ["Old1", "Old2", "Old3", "Stopped"]
+    assert names(repo, 'jadwal') == ["New"]
+    assert repo.lease_outbox(10, timedelta(minutes=1)) == []
+    conn = repo.connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM outbox").fetchone() == (0,)
+    finally:
+        repo.release(conn)
+
+
+def test_run_once_deletes_without_archive(repo):
+    repo.insert_jadwal("Old", datetime.now() - timedelta(days=40), 1, [60])
+    assert asyncio.run(RetentionJob(repo, days=30, archive=False, pause=0).run_once()) == 1
+    assert names(repo, 'jadwal_archive') == []
+    assert names(repo, 'jadwal') == []
@@ -0,0 +1,176 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from scheduler import ReminderScheduler
+
+
+class FakeReminders:
+    """Reminder rows with claims, standing in for the repository"""
+
+    def __init__(self):
+        self.rows = []
+        self.claimed = set()
+        self.down = False
+        self.sent = []
+        self.missed = []
+
+    def add(self, jadwal_id, fire_at, chat_id=1, minutes=60):
+        row = {
+            'id': jadwal_id, 'offset_minutes': minutes, 'fire_at': fire_at, 'chat_id': chat_id,
+            'nama_event': f"E{jadwal_id}", 'tanggal_event': fire_at + timedelta(minutes=minutes),
+        }
+        self.rows.append(row)
+        return row
+
+    def _unclaimed(self, start, end):
+        return sorted(
+            (r for r in self.rows if start <= r['fire_at'] < end and (r['id'], r['offset_minutes']) not in self.claimed),
+            key=lambda r: r['fire_at']
+        )
+
+    def load_upcoming(self, start, end):
+        return None if self.down else self._unclaimed(start, end)
+
+    def load_missed(self, since, until, limit):
+        return None if self.down else self._unclaimed(since, until)[:limit]
+
+    def _claim(self, group, into):
+        if self.down:
+            return False
+        claimed = [r['id'] for r in group if (r['id'], r['offset_minutes']) not in self.claimed]
+        self.claimed.update((r['id'], r['offset_minutes']) for r in group)
+        if claimed:
+            into.append(claimed)
+        return True
+
+    async def dispatch(self, group):
+        return self._claim(group, self.sent)
+
+    async def dispatch_missed(self, group):
+        return self._claim(group, self.missed)
+
+
+def soon(seconds):
+    return datetime.now() + timedelta(seconds=seconds)
+
+
+async def run_for(scheduler, store, seconds, during=None, catch_up=True):
+    task = asyncio.create_task(
+        scheduler.run(store.dispatch, store.dispatch_missed if catch_up else None)
+    )
+    try:
+        if during is not None:
+            await during()
+        await asyncio.sleep(seconds)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def make(store, **kwargs):
+    return ReminderScheduler(store.load_upcoming, load_missed=store.load_missed, **kwargs)
+
+
+def test_reminders_fire_at_their_time_and_cancel():
+    store = FakeReminders()
+    store.add(1, soon(0.2))
+    store.add(2, soon(0.2))
+    store.add(3, soon(30))
+    scheduler = make(store)
+
+    async def during():
+        await asyncio.sleep(0.05)
+        scheduler.cancel_jadwal(2)
+        assert store.sent == []
+
+    asyncio.run(run_for(scheduler, store, 0.5, during))
+    assert store.sent == [[1]]
+    assert store.missed == []
+
+
+def test_schedule_reminders_wakes_the_scheduler():
+    store = FakeReminders()
+    scheduler = make(store)
+
+    async def during():
+        await asyncio.sleep(0.1)
+        scheduler.schedule_reminders([store.add(1, soon(0.1))])
+
+    asyncio.run(run_for(scheduler, store, 0.4, during))
+    assert store.sent == [[1]]
+
+
+def test_refresh_reloads_from_the_last_pass():
+    # A reminder only in the database (saved on another replica) fires well before the
+    # refresh; the rebuilt window must still include it
+    store = FakeReminders()
+    scheduler = make(store)
+
+    async def during():
+        await asyncio.sleep(0.1)
+        store.add(1, soon(0.1))
+        await asyncio.sleep(1.5)
+        scheduler.refresh()
+
+    asyncio.run(run_for(scheduler, store, 0.2, during, catch_up=False))
+    assert store.sent == [[1]]
+
+
+def test_digest_groups_a_chats_reminders():
+    store = FakeReminders()
+    store.add(1, soon(0.1), chat_id=1)
+    store.add(2, soon(20), chat_id=1)  # inside the window: goes out early with 1
+    store.add(3, soon(0.1), chat_id=2)
+    store.add(4, soon(120), chat_id=1)  # outside the window
+    scheduler = make(store, digest_window=60)
+
+    asyncio.run(run_for(scheduler, store, 0.4, catch_up=False))
+    assert sorted(store.sent) == [[1, 2], [3]]
+
+
+def test_startup_catches_up_per_chat():
+    store = FakeReminders()
+    store.add(1, soon(-3600), chat_id=1)
+    store.add(2, soon(-1800), chat_id=1)
+    store.add(3, soon(-600), chat_id=2)
+    store.add(4, soon(-7 * 3600), chat_id=2)  # older than the catch-up window
+    scheduler = make(store, catch_up=timedelta(hours=6))
+
+    asyncio.run(run_for(scheduler, store, 0.3))
+    assert sorted(store.missed) == [[1, 2], [3]]
+    assert store.sent == []
+
+
+def test_failed_dispatch_is_caught_up():
+    store = FakeReminders()
+    store.add(1, soon(0.1))
+    scheduler = make(store)
+    original = store.dispatch
+    failures = []
+
+    async def flaky(group):
+        if not failures:
+            failures.append(group)
+            return False  # database unavailable
+        return await original(group)
+
+    store.dispatch = flaky
+    asyncio.run(run_for(scheduler, store, 0.4))
+    assert len(failures) == 1
+    assert store.missed == [[1]]
+
+
+def test_reload_failure_is_caught_up_after_recovery():
+    store = FakeReminders()
+    scheduler = make(store)
+
+    async def during():
+        await asyncio.sleep(0.1)
+        store.down = True
+        scheduler.refresh()
+        store.add(1, soon(0.1))
+        await asyncio.sleep(0.5)
+        store.down = False
+
+    asyncio.run(run_for(scheduler, store, 1.5, during))
+    assert store.sent + store.missed == [[1]]
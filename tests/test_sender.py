@@ -0,0 +1,78 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from sender import DeliveryQueue
+
+
+class FakeBot:
+    """Records send times; errors[chat_id] lists exceptions to raise before succeeding"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.started = time.monotonic()
+        self.sends = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sends.append((chat_id, time.monotonic() - self.started))
+
+
+async def deliver(queue, chat_ids):
+    results = {}
+    await queue.start()
+    for i, chat_id in enumerate(chat_ids):
+        async def on_done(sent, i=i):
+            results[i] = sent
+        await queue.put(chat_id, f"pesan {i}", on_done=on_done)
+    await queue.stop(drain_timeout=10)
+    return [results[i] for i in range(len(chat_ids))]
+
+
+def test_per_chat_rate_does_not_hold_up_other_chats():
+    bot = FakeBot()
+    queue = DeliveryQueue(bot, concurrency=8, global_rate=100, per_chat_rate=2)
+    assert asyncio.run(deliver(queue, [1, 1, 1, 1, 2])) == [True] * 5
+    chat_1 = [at for chat_id, at in bot.sends if chat_id == 1]
+    chat_2 = [at for chat_id, at in bot.sends if chat_id == 2]
+    # A burst of 2, then one message every half second
+    assert chat_1[2] >= 0.45 and chat_1[3] >= 0.95
+    assert chat_2[0] < 0.3
+
+
+def test_global_rate():
+    bot = FakeBot()
+    queue = DeliveryQueue(bot, concurrency=8, global_rate=4, per_chat_rate=100)
+    asyncio.run(deliver(queue, range(1, 7)))
+    assert sorted(at for _, at in bot.sends)[-1] >= 0.45
+
+
+def test_retries_transient_errors_and_gives_up_on_rejection():
+    bot = FakeBot({
+        1: [NetworkError("timeout")],
+        2: [BadRequest("chat not found")],
+        3: [RetryAfter(timedelta(milliseconds=300))],
+    })
+    queue = DeliveryQueue(bot, concurrency=3, global_rate=100, per_chat_rate=100)
+    assert asyncio.run(deliver(queue, [1, 2, 3])) == [True, False, True]
+    assert queue.stats() == {'queue_depth': 0, 'sent': 2, 'failed': 1, 'retried': 2}
+    assert dict(bot.sends)[3] >= 0.3
+
+
+def test_stop_reports_undelivered_messages():
+    results = []
+
+    async def on_done(sent):
+        results.append(sent)
+
+    async def scenario():
+        queue = DeliveryQueue(FakeBot())
+        await queue.put(1, "pesan", on_done=on_done)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert results == [False]
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import recurrence
+
+
+def reminder_rows(repo):
+    conn = repo.connect()
+    try:
+        return conn.execute(
+            "SELECT jadwal_id, offset_minutes, claimed_at IS NOT NULL, sent_at IS NOT NULL "
+            "FROM reminders ORDER BY jadwal_id, offset_minutes DESC"
+        ).fetchall()
+    finally:
+        repo.release(conn)
+
+
+def test_insert_jadwals_returns_ids_in_row_order(repo):
+    now = datetime.now()
+    rows = [(f"E{i % 3}", now + timedelta(hours=2, minutes=i), i % 2, [60]) for i in range(20)]
+    ids = repo.insert_jadwals(rows)
+    assert len(set(ids)) == 20
+    conn = repo.connect()
+    try:
+        for (name, _, chat_id, _), jadwal_id in zip(rows, ids):
+            assert conn.execute(
+                "SELECT nama_event, chat_id FROM jadwal WHERE id = ?", (jadwal_id,)
+            ).fetchone() == (name, chat_id)
+    finally:
+        repo.release(conn)
+
+
+def test_advance_recurring_moves_the_series_and_its_reminders(repo):
+    now = datetime.now()
+    start = now - timedelta(days=1, minutes=-30)
+    jadwal_id = repo.insert_jadwal("Daily", start, 1, [720, 10], recurrence.make_rule('daily', start))
+    assert repo.advance_recurring(now) == 1
+    rows, _ = repo.get_active_jadwals_page(1, 10)
+    assert rows[0]['tanggal_event'] == start + timedelta(days=1)
+    # H-12 of the new occurrence is already past, H-10 minutes is still to come
+    assert reminder_rows(repo) == [(jadwal_id, 720, 1, 1), (jadwal_id, 10, 0, 0)]
+    assert repo.advance_recurring(now) == 0
+
+
+def test_upcoming_reminders(repo):
+    now = datetime.now()
+    repo.insert_jadwal("A", now + timedelta(minutes=90), 1, [60])
+    repo.insert_jadwal("B", now + timedelta(minutes=200), 1, [60, 120])
+    upcoming = repo.load_upcoming_reminders(now, now + timedelta(hours=2))
+    assert [(r['nama_event'], r['offset_minutes']) for r in upcoming] == [('A', 60), ('B', 120)]
+
+
+def test_reminders_already_past_are_stored_as_sent(repo):
+    now = datetime.now()
+    jadwal_id = repo.insert_jadwal("Soon", now + timedelta(minutes=30), 1, [720, 60, 10])
+    assert reminder_rows(repo) == [(jadwal_id, 720, 1, 1), (jadwal_id, 60, 1, 1), (jadwal_id, 10, 0, 0)]
+    assert repo.load_missed_reminders(now - timedelta(hours=24), now, 100) == []
+
+
+def test_missed_reminders(repo, monkeypatch):
+    now = datetime.now()
+    repo.insert_jadwal("A", now + timedelta(minutes=90), 1, [60])
+    repo.insert_jadwal("B", now + timedelta(minutes=200), 1, [60])
+    later = now + timedelta(hours=3)
+    assert [r['nama_event'] for r in repo.load_missed_reminders(now, later, 1)] == ['A']
+    assert [r['nama_event'] for r in repo.load_missed_reminders(now, later, 10)] == ['A', 'B']
+    monkeypatch.setattr(repo, 'connect', lambda: None)
+    assert repo.load_missed_reminders(now, later, 10) is None
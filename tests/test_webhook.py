@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from webhook import WEBHOOK_PATH, WebhookServer
+
+
+class FakeApplication:
+    def __init__(self, running=True):
+        self.running = running
+        self.bot = None
+        self.update_queue = asyncio.Queue()
+
+
+async def request(server, method, path, body=b'', headers=()):
+    listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        head = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}", *headers]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        response = await reader.read()
+        writer.close()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+    status_line, _, rest = response.partition(b'\r\n')
+    payload = rest.split(b'\r\n\r\n', 1)[1]
+    return int(status_line.split()[1]), json.loads(payload) if payload else None
+
+
+UPDATE = json.dumps({'update_id': 7}).encode()
+
+
+def test_webhook_requires_the_secret_token():
+    async def scenario():
+        application = FakeApplication()
+        server = WebhookServer(application, secret='s3cret')
+        assert (await request(server, 'POST', WEBHOOK_PATH, UPDATE))[0] == 403
+        assert (await request(server, 'POST', WEBHOOK_PATH, UPDATE,
+                              ["X-Telegram-Bot-Api-Secret-Token: wrong"]))[0] == 403
+        assert application.update_queue.empty()
+        assert (await request(server, 'POST', WEBHOOK_PATH, UPDATE,
+                              ["X-Telegram-Bot-Api-Secret-Token: s3cret"]))[0] == 200
+        assert (await application.update_queue.get()).update_id == 7
+    asyncio.run(scenario())
+
+
+def test_webhook_rejects_bad_requests():
+    async def scenario():
+        server = WebhookServer(FakeApplication())
+        assert (await request(server, 'POST', WEBHOOK_PATH, b'not json'))[0] == 400
+        assert (await request(server, 'GET', WEBHOOK_PATH))[0] == 405
+        assert (await request(server, 'GET', '/metrics'))[0] == 404
+    asyncio.run(scenario())
+
+
+def test_health_reports_the_database_without_failing():
+    async def scenario():
+        down = WebhookServer(FakeApplication(), health_check=lambda: False)
+        assert await request(down, 'GET', '/health') == (
+            200, {'status': 'degraded', 'running': True, 'database': False}
+        )
+        up = WebhookServer(FakeApplication(), health_check=lambda: True)
+        assert (await request(up, 'GET', '/health'))[1]['status'] == 'ok'
+        stopped = WebhookServer(FakeApplication(running=False), health_check=lambda: True)
+        assert (await request(stopped, 'GET', '/health'))[0] == 503
+    asyncio.run(scenario())
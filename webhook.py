@@ -0,0 +1,138 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+from telegram import Update
+from telegram.ext import Application
+from db import run_db
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = '/webhook'
+# Telegram updates are a few KB; anything far bigger is not from Telegram
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+# A client gets this long to send its request and read the response
+REQUEST_TIMEOUT = 10
+
+
+class WebhookServer:
+    """Minimal HTTP/1.1 server for Telegram's webhook and /health, on the Application's event loop
+
+    Each connection is a coroutine, not a thread: a verified update is put on the
+    Application's update queue and answered right away, handlers run concurrently
+    as in polling mode. health_check() reports whether the database is reachable.
+    """
+
+    def __init__(self, application: Application, secret=None, health_check=None):
+        self.application = application
+        self.secret = secret
+        self.health_check = health_check
+
+    async def handle(self, reader, writer):
+        try:
+            status, body = await asyncio.wait_for(self._respond(reader), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, body = HTTPStatus.BAD_REQUEST, None
+        except ConnectionError:
+            writer.close()
+            return
+        payload = json.dumps(body).encode() if body is not None else b''
+        head = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Length: {len(payload)}",
+            "Connection: close",
+        ]
+        if body is not None:
+            head.append("Content-Type: application/json")
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + payload)
+            await asyncio.wait_for(writer.drain(), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        # (HTTPStatus, JSON body or None) for one request
+        method, target, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            return HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, None
+        path = target.split('?', 1)[0]
+
+        if path == WEBHOOK_PATH:
+            if method != 'POST':
+                return HTTPStatus.METHOD_NOT_ALLOWED, None
+            if self.secret:
+                token = headers.get('x-telegram-bot-api-secret-token', '')
+                if not hmac.compare_digest(token.encode(), self.secret.encode()):
+                    return HTTPStatus.FORBIDDEN, None
+            length = int(headers.get('content-length', '0'))
+            if length > MAX_BODY_BYTES:
+                return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, None
+            try:
+                data = json.loads(await reader.readexactly(length))
+            except ValueError:
+                return HTTPStatus.BAD_REQUEST, None
+            if not isinstance(data, dict) or not data:
+                return HTTPStatus.BAD_REQUEST, None
+            # Only enqueue here; handlers run concurrently on the Application's loop
+            await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+            return HTTPStatus.OK, None
+
+        if path == '/health':
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, None
+            # Liveness only depends on the bot; a database outage is reported, not failed,
+            # since restarting the bot would not bring the database back
+            running = self.application.running
+            database = await run_db(self.health_check) if self.health_check else None
+            status = 'ok' if running and database is not False else 'degraded'
+            return HTTPStatus.OK if running else HTTPStatus.SERVICE_UNAVAILABLE, dict(
+                status=status, running=running, database=database
+            )
+
+        return HTTPStatus.NOT_FOUND, None
+
+
+async def _serve(application: Application, url, listen, port, secret, health_check):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        # Pending updates are kept: Telegram redelivers whatever arrived while we were down
+        await application.bot.set_webhook(
+            url=url.rstrip('/') + WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await application.start()
+        server = await asyncio.start_server(WebhookServer(application, secret, health_check).handle, listen, port)
+        logger.info(f"Webhook server listening on {listen}:{port}")
+
+        await stop.wait()
+
+        logger.info("Shutting down webhook server")
+        server.close()
+        await server.wait_closed()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+
+
+def run_webhook(application: Application, url, listen='0.0.0.0', port=8080, secret=None, health_check=None):
+    """Serve updates over HTTP until SIGINT/SIGTERM, as an alternative to run_polling"""
+    asyncio.run(_serve(application, url, listen, port, secret, health_check))